@@ -0,0 +1,336 @@
+"""
+Benchmarks of the map generation, the water pass, texturing and rendering
+
+Every benchmark is timed repeat times on maps of fixed seeds, then run once more under
+tracemalloc for its peak memory (Qt's own allocations are not traced). Results are
+written to a JSON file, so runs of different commits can be compared with --compare
+
+    python benchmarks/run.py --sizes 43x28 100x100 --out before.json
+    python benchmarks/run.py --sizes 43x28 100x100 --out after.json --compare before.json
+
+With --workers the step and run benchmarks are also timed on maps split into stripes,
+see ArrayGrid.split, and their speedup over a single process is printed
+
+    python benchmarks/run.py --benchmarks run --engines numpy --sizes 800x800 --workers 1 4
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+# pylint: disable=wrong-import-position
+from cli import parse_size
+from engines import ENGINES, available, make_grid
+from stripes import stripes
+
+SEEDS = ("bench0", "bench1")
+SIZES = ("43x28", "100x100", "250x250")
+# Steps made before a single step is timed, the first ones barely touch the map
+WARMUP_STEPS = 10
+# Benchmarks timed on split maps as well
+SPLIT = ("step", "run")
+
+
+def _init(engine, rows, cols, seed):
+    return lambda: ENGINES[engine](rows, cols, seed)
+
+
+def _step(engine, rows, cols, seed, workers=1):
+    grid = make_grid(engine, rows, cols, seed, workers)
+    for _ in range(WARMUP_STEPS):
+        grid.update_grid()
+    return grid.update_grid
+
+
+def _run(engine, rows, cols, seed, workers=1):
+    return make_grid(engine, rows, cols, seed, workers).run_to_completion
+
+
+def _biome_distribution(engine, rows, cols, seed):
+    grid = ENGINES[engine](rows, cols, seed)
+    while not grid.destinations[0]:
+        grid.update_grid()
+    return grid.biome_distribution
+
+
+def _change_water(engine, rows, cols, seed):
+    grid = ENGINES[engine](rows, cols, seed)
+    while not grid.destinations[1]:
+        grid.update_grid()
+    return grid._change_water  # pylint: disable=protected-access
+
+
+_WINDOW = None
+
+
+def _widget(engine, rows, cols, seed):
+    """
+    Grid widget of a map of the given size and engine in an offscreen main window
+    """
+    # pylint: disable=global-statement,import-outside-toplevel
+    global _WINDOW
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    from ui.main_window import MainWindow
+
+    app = QApplication.instance() or QApplication([])
+    if _WINDOW is None:
+        _WINDOW = MainWindow()
+        _WINDOW.show()
+    _WINDOW.grid.discard_recording()
+    _WINDOW.grid.setParent(None)
+    _WINDOW.side_panel.engine_box.setCurrentText(engine)
+    _WINDOW.init_grid((rows, cols), seed)
+    app.processEvents()
+    return app, _WINDOW.grid
+
+
+def _textures(engine, rows, cols, seed):
+    app, widget = _widget(engine, rows, cols, seed)
+    widget.generate_instantly()
+    while widget.replay is None:
+        app.processEvents()
+    button = _WINDOW.side_panel.textures_button
+
+    def apply():
+        button.click()
+        widget.repaint()
+
+    return apply
+
+
+def _frame(engine, rows, cols, seed):
+    _, widget = _widget(engine, rows, cols, seed)
+    for _ in range(WARMUP_STEPS):
+        widget.worker.step()
+
+    def frame():
+        # Called on this thread the worker hands its frame over right away
+        widget.worker.step()
+        widget.repaint()
+
+    return frame
+
+
+# name: (setup, needs Qt), setup returns the function to time
+BENCHMARKS = {
+    "init": (_init, False),
+    "step": (_step, False),
+    "run": (_run, False),
+    "biome_distribution": (_biome_distribution, False),
+    "change_water": (_change_water, False),
+    "textures": (_textures, True),
+    "frame": (_frame, True),
+}
+
+
+def _skip_reason(name, engine, rows, cols, workers, args):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # pylint: disable=too-many-return-statements
+    if not available(engine):
+        return f"the {engine} engine is not available"
+    if workers > 1:
+        if name not in SPLIT or engine == "reference":
+            return "only step and run of the numpy and numba engines are split"
+        if stripes((rows, cols), workers) < 2:
+            return "too small to be split, see stripes.MIN_CELLS"
+    if BENCHMARKS[name][1] and max(rows, cols) > 500:
+        return "UI maps are at most 500x500"
+    if engine == "reference" and rows * cols > args.max_cells:
+        return f"over --max-cells {args.max_cells} for the reference engine"
+    return None
+
+
+def measure(name, engine, rows, cols, seed, repeat, workers=1):
+    """
+    Time a benchmark repeat times and measure its peak memory, every run gets a fresh
+    setup; the peak memory of a split map is the main process' only
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    setup = BENCHMARKS[name][0]
+    options = {"workers": workers} if workers > 1 else {}
+    times = []
+    for _ in range(repeat):
+        func = setup(engine, rows, cols, seed, **options)
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func = setup(engine, rows, cols, seed, **options)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return {
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_memory": peak,
+    }
+
+
+def _key(result):
+    return (
+        result["benchmark"],
+        result["engine"],
+        tuple(result["size"]),
+        result["seed"],
+        result.get("workers", 1),
+    )
+
+
+def _case(result):
+    cols, rows = result["size"]
+    return (
+        f"{result['benchmark']:>20} {result['engine']:>9} {cols:>5}x{rows:<5}"
+        f" {result['seed']:>8} {result.get('workers', 1):>3}"
+    )
+
+
+def speedups(results):
+    """
+    Print the speedup of every split case over the same one in a single process
+    """
+    single = {_key(result): result for result in results if result["workers"] == 1}
+    lines = []
+    for result in results:
+        before = single.get(_key({**result, "workers": 1}))
+        if result["workers"] == 1 or "min" not in result:
+            continue
+        if before is None or "min" not in before:
+            continue
+        lines.append(f"{_case(result)} {before['min'] / result['min']:8.2f}x")
+    if lines:
+        print("\nSpeedup over 1 worker (old / new minimal time):")
+        print("\n".join(lines))
+
+
+def compare(results, path):
+    """
+    Print the ratio of every minimal time to the one of the same case in an older run
+    """
+    with open(path, encoding="utf-8") as file:
+        old = {_key(result): result for result in json.load(file)["results"]}
+    print(f"\nCompared to {path} (new / old minimal time):")
+    for result in results:
+        before = old.get(_key(result))
+        if "min" not in result or before is None or "min" not in before:
+            continue
+        print(f"{_case(result)} {result['min'] / before['min']:8.2f}x")
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point of the benchmarks
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=parse_size,
+        default=[parse_size(size) for size in SIZES],
+        help=f"map sizes as COLSxROWS, {' '.join(SIZES)} by default",
+    )
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument(
+        "--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS)
+    )
+    parser.add_argument("--seeds", nargs="+", default=list(SEEDS))
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument(
+        "--workers",
+        nargs="+",
+        type=int,
+        default=[1],
+        help="processes stepping a split map, step and run only, 1 by default",
+    )
+    parser.add_argument(
+        "--max-cells",
+        type=int,
+        default=250_000,
+        help="largest map for the reference engine, it keeps an object per cell",
+    )
+    parser.add_argument("--out", default="benchmarks.json", help="JSON results file")
+    parser.add_argument("--compare", help="older JSON results file to compare with")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out)
+    old = args.compare and os.path.abspath(args.compare)
+    # Textures are looked up relative to the working directory
+    os.chdir(ROOT)
+
+    results = []
+    for name, engine, (rows, cols), seed, workers in itertools.product(
+        args.benchmarks, args.engines, args.sizes, args.seeds, args.workers
+    ):
+        result = {
+            "benchmark": name,
+            "engine": engine,
+            "size": [cols, rows],
+            "seed": seed,
+            "workers": workers,
+        }
+        reason = _skip_reason(name, engine, rows, cols, workers, args)
+        if reason is None:
+            result.update(measure(name, engine, rows, cols, seed, args.repeat, workers))
+            print(
+                f"{_case(result)} {result['min'] * 1000:10.2f}ms"
+                f" {result['peak_memory'] / 2**20:8.1f}MiB",
+                flush=True,
+            )
+        else:
+            result["skipped"] = reason
+        results.append(result)
+    if _WINDOW is not None:
+        _WINDOW.close()
+
+    with open(out, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "commit": _commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    speedups(results)
+    if old:
+        compare(results, old)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,685 @@
+"""
+Vectorized map/grid class
+"""
+
+import numpy as np
+
+from cells import (
+    Cell,
+    CELL_TYPES,
+    VOID,
+    WATER,
+    SWAMP,
+)
+from grid import (
+    NEIGHBOURS,
+    Grid,
+    Changes,
+    distance_transform,
+    no_candidates,
+    secondary_codes,
+    shore_water,
+)
+from rules import RULES
+from rng import INFECTION, PLACEMENT, Stream, hashes, to_unit
+import snapshot
+from stripes import FIELDS, StripePool, stripes
+
+THRESHOLDS = np.array([cls.THRESHOLD_AGE for cls in CELL_TYPES], dtype=np.float64)
+
+# Same order as Grid.get_neighbours, the first successful source claims a target
+DIRECTIONS = NEIGHBOURS
+
+
+def _shift(direction, n, m):
+    """
+    Get source and target slices for a given neighbour direction
+    """
+    di, dj = direction
+    src = (
+        slice(max(-di, 0), n - max(di, 0)),
+        slice(max(-dj, 0), m - max(dj, 0)),
+    )
+    dst = (
+        slice(max(di, 0), n - max(-di, 0)),
+        slice(max(dj, 0), m - max(-dj, 0)),
+    )
+    return src, dst
+
+
+def count_coeffs(types: np.ndarray) -> np.ndarray:
+    """
+    Count the number of same type cells in square 3x3 for every cell at once
+    """
+    n, m = types.shape
+    padded = np.pad(types, 1, constant_values=np.iinfo(np.uint8).max)
+    coeffs = np.zeros(types.shape, dtype=np.int32)
+    for di in range(3):
+        for dj in range(3):
+            coeffs += padded[di : di + n, dj : dj + m] == types
+    return coeffs
+
+
+def can_grow(types, age, threshold) -> bool:
+    """
+    Whether a land cell is still young enough and has a neighbour it can infect, same
+    as the frontier of Grid
+    """
+    young = (types != WATER) & (age <= threshold)
+    if not young.any():
+        return False
+    n, m = types.shape
+    for direction in DIRECTIONS:
+        src, dst = _shift(direction, n, m)
+        if (young[src] & RULES.allowed[types[src], types[dst]]).any():
+            return True
+    return False
+
+
+def infect(types, age, threshold, height, active, cell_keys, ind, step):
+    """
+    Make a step of the infection, synchronously for all cells of the given arrays
+    Returns the new types, age, threshold, height and active arrays and the mask of the
+    converted cells, the given arrays are left as they are
+    """
+    n, m = types.shape
+    coeff = count_coeffs(types)
+    # Same as in Grid._update, the count is 0 for biomes whose rules don't use it
+    coeff[~RULES.uses_coeff[types]] = 0
+    age_coeff = np.where(age > 3, 1 - age / threshold, 0)
+    alive = age <= threshold
+
+    converted = np.zeros(types.shape, dtype=bool)
+    new_types = types.copy()
+    new_age = age.copy()
+    new_threshold = threshold.copy()
+    height = height.copy()
+    active = active.copy()
+    shifted = np.zeros(types.shape, dtype=bool)
+    height_rolls = np.zeros(types.shape)
+    # Same keys as the rolls of Grid._update, (cell, phase, step, direction, slot)
+    # Only living cells of biomes with rolls roll, water takes void for sure
+    rolling = alive & RULES.rolls[types]
+    step_keys = np.zeros(types.shape, dtype=np.uint64)
+    step_keys[rolling] = hashes(cell_keys[rolling], ind, step)
+    for index, direction in enumerate(DIRECTIONS):
+        src, dst = _shift(direction, n, m)
+        need = rolling[src]
+        keys = hashes(step_keys[src][need], index)
+        rolls = np.zeros(need.shape)
+        rolls[need] = to_unit(hashes(keys, 0))
+        success = (
+            alive[src]
+            & ~converted[dst]
+            & RULES.infection_mask(
+                types[src], types[dst], coeff[src], age_coeff[src], rolls
+            )
+        )
+        active[src] |= success
+        converted[dst] |= success
+        new_types[dst] = np.where(success, types[src], new_types[dst])
+        new_age[dst] = np.where(success, age[src] + 1, new_age[dst])
+        new_threshold[dst] = np.where(success, threshold[src], new_threshold[dst])
+        shifted[dst] |= success & RULES.rolls_height[types[src]]
+        # Height rolls are only needed where a land cell took a target
+        height_rolls[dst][success & need] = to_unit(hashes(keys[success[need]], 1))
+
+    height -= shifted & (height_rolls < 0.2)
+    height += shifted & (height_rolls > 0.8)
+    new_age += active & ~converted
+    active |= converted
+    return new_types, new_age, new_threshold, height, active, converted
+
+
+def neighbours(cells: np.ndarray, n: int, m: int) -> np.ndarray:
+    """
+    Get the flat indices of the neighbours of cells given as flat indices of an n x m
+    map, one row per direction of DIRECTIONS, -1 for neighbours off the map
+    """
+    xs, ys = np.divmod(cells, m)
+    res = np.full((len(DIRECTIONS), len(cells)), -1, dtype=np.int64)
+    for index, (di, dj) in enumerate(DIRECTIONS):
+        x, y = xs + di, ys + dj
+        inside = (x >= 0) & (x < n) & (y >= 0) & (y < m)
+        res[index, inside] = x[inside] * m + y[inside]
+    return res
+
+
+def count_coeffs_at(types: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """
+    Count the number of same type cells in square 3x3 of cells given as flat indices,
+    same as count_coeffs
+    """
+    n, m = types.shape
+    flat = types.reshape(-1)
+    xs, ys = np.divmod(cells, m)
+    own = flat[cells]
+    coeffs = np.zeros(len(cells), dtype=np.int32)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            x, y = xs + di, ys + dj
+            inside = (x >= 0) & (x < n) & (y >= 0) & (y < m)
+            coeffs[inside] += flat[x[inside] * m + y[inside]] == own[inside]
+    return coeffs
+
+
+def grows(types, cells, n, m):
+    """
+    Get whether cells given as flat indices of an n x m map have a neighbour they can
+    infect, types are the flat type codes of the map
+    """
+    res = np.zeros(len(cells), dtype=bool)
+    for targets in neighbours(cells, n, m):
+        inside = targets >= 0
+        res[inside] |= RULES.allowed[types[cells[inside]], types[targets[inside]]]
+    return res
+
+
+def claims(types, cells, ages, thresholds, step_keys, converted, n, m):
+    """
+    Get the targets the cells of a frontier, given as flat indices of an n x m map with
+    their ages and thresholds, take in a step, in the order of DIRECTIONS then of the
+    cells, types are the flat type codes of the map
+    Returns the indices of the sources in cells, the flat indices of their targets and
+    the height rolls of the targets, 0 unless the source rolls, targets are marked in
+    converted
+    """
+    source = types[cells]
+    coeff = count_coeffs_at(types.reshape(n, m), cells)
+    coeff[~RULES.uses_coeff[source]] = 0
+    age_coeff = np.where(ages > 3, 1 - ages / thresholds, 0)
+    rolling = RULES.rolls[source]
+    sources, targets, height_rolls = [], [], []
+    for index, around in enumerate(neighbours(cells, n, m)):
+        inside = np.flatnonzero(around >= 0)
+        dst = around[inside]
+        need = rolling[inside]
+        keys = hashes(step_keys[inside][need], index)
+        rolls = np.zeros(len(inside))
+        rolls[need] = to_unit(hashes(keys, 0))
+        success = ~converted[dst] & RULES.infection_mask(
+            source[inside], types[dst], coeff[inside], age_coeff[inside], rolls
+        )
+        converted[dst[success]] = True
+        sources.append(inside[success])
+        targets.append(dst[success])
+        # Height rolls are only needed where a land cell took a target
+        shift = np.zeros(len(inside))
+        shift[success & need] = to_unit(hashes(keys[success[need]], 1))
+        height_rolls.append(shift[success])
+    return (
+        np.concatenate(sources),
+        np.concatenate(targets),
+        np.concatenate(height_rolls),
+    )
+
+
+class CellView:
+    """
+    Cell-like view of a single position of an ArrayGrid
+    """
+
+    color = Cell.color
+    age_coeff = Cell.age_coeff
+    get_subtype = Cell.get_subtype
+
+    def __init__(self, grid: "ArrayGrid", x: int, y: int) -> None:
+        self._grid = grid
+        self.x, self.y = x, y
+
+    def __getattr__(self, name):
+        # Per-type constants, TYPE, TYPE_ID, SUBTYPES, COLOR, PROBABILITY...
+        if name.isupper():
+            return getattr(CELL_TYPES[self._grid.types[self.x, self.y]], name)
+        raise AttributeError(name)
+
+    @property
+    def type(self):
+        """
+        Cell's type name
+        """
+        return self.TYPE
+
+    @property
+    def age(self):
+        """
+        Cell's age
+        """
+        return self._grid.cell_age(self.x, self.y)
+
+    @property
+    def threshold_age(self):
+        """
+        Cell's threshold age
+        """
+        return float(self._grid.threshold[self.x, self.y])
+
+    @property
+    def height(self):
+        """
+        Cell's height
+        """
+        return float(self._grid.height[self.x, self.y])
+
+    @property
+    def changed(self):
+        """
+        Whether the cell was changed during the current step
+        """
+        return bool(self._grid.changed[self.x, self.y])
+
+    @property
+    def active(self):
+        """
+        Whether the cell has infected or has been infected
+        """
+        return bool(self._grid.active[self.x, self.y])
+
+    @property
+    def texture(self):
+        """
+        Whether a texture is applied to the cell
+        """
+        return bool(self._grid.texture[self.x, self.y])
+
+    @texture.setter
+    def texture(self, value):
+        self._grid.texture[self.x, self.y] = value
+
+    def __repr__(self):
+        return f"{self.type} ({self.x}, {self.y})"
+
+
+class _CellMap:
+    """
+    Indexable as map[i][j], returns cell views
+    """
+
+    def __init__(self, grid: "ArrayGrid") -> None:
+        self._grid = grid
+
+    def __getitem__(self, i):
+        return _CellRow(self._grid, i)
+
+
+class _CellRow:
+    def __init__(self, grid: "ArrayGrid", i: int) -> None:
+        self._grid = grid
+        self._i = i
+
+    def __getitem__(self, j):
+        return CellView(self._grid, self._i, j)
+
+    def __len__(self):
+        return self._grid.n_cols
+
+
+class ArrayGrid(Grid):
+    """
+    Grid class that keeps the map as typed NumPy arrays and updates all cells at once
+    Cells are updated synchronously, every cell infects its neighbours according to the
+    state at the start of the step, a target claimed by several sources is taken by the
+    first one in the get_neighbours order
+    Same as Grid, only the frontier is stepped, cells young enough that have a
+    neighbour they can infect, and the ages of idle active cells are brought up to date
+    lazily from a per-cell step clock; the maps are the same as infect's on the whole
+    map
+    """
+
+    ENGINE = "numpy"
+    # Whether a step only visits the frontier, rather than running _kernel on the map
+    FRONTIER = True
+    # Step of the engine, see infect
+    _kernel = staticmethod(infect)
+    # Frontier of the map and the targets it takes in a step, see grows and claims
+    _grows = staticmethod(grows)
+    _claims = staticmethod(claims)
+    _stripes = None
+
+    def __init__(
+        self, n: int, m: int, seed: str | None = None, workers: int = 1
+    ) -> None:
+        # The map's arrays and cell views, see set_up
+        self.types = self.age = self.threshold = self.height = None
+        self.changed = self.active = self.texture = self._dirty = None
+        self._cell_keys = self._clock = self._frontier = self._map = None
+        self._step = 0
+        # Cells converted by the last step and, if split, whether land can still grow
+        self._converted, self._growing = 0, False
+        super().__init__(n, m, seed, workers)
+
+    def set_up(self):
+        """
+        Set the map up
+        """
+        self.close()
+        self._seed_streams()
+        shape = (self._n, self._m)
+        self.types = np.full(shape, VOID, dtype=np.uint8)
+        self.age = np.zeros(shape, dtype=np.int32)
+        self.threshold = np.full(shape, THRESHOLDS[VOID], dtype=np.float64)
+        self.height = np.full(shape, 10, dtype=np.float64)
+        self.changed = np.zeros(shape, dtype=bool)
+        self.active = np.zeros(shape, dtype=bool)
+        self.texture = np.zeros(shape, dtype=bool)
+        self._dirty = np.zeros(shape, dtype=bool)
+        self._map = _CellMap(self)
+        self._step = 0
+        # Step each age was brought up to date at, None while the ages are up to date
+        self._clock = None
+        # Frontier as increasing flat indices, None until the next step finds it
+        self._frontier = None
+        for new, cls in self.initial_biomes(Stream(self._key, PLACEMENT, 0)):
+            self._place(new, cls.TYPE_ID)
+
+    def split(self, workers: int) -> None:
+        """
+        Step the map in stripes, one process per stripe, the maps are the same for any
+        number of workers
+        The arrays are moved to shared memory, close stops the processes; a map too
+        small for several stripes, see stripes.MIN_CELLS, stays in this process
+        """
+        self.close()
+        if stripes(self.types.shape, workers) < 2:
+            return
+        if self._clock is None:
+            self._clock = np.full(self.types.shape, self._step, dtype=np.int64)
+        self._frontier = None
+        self._stripes = StripePool(
+            {name: getattr(self, name) for name in FIELDS}, type(self), workers
+        )
+        for name, array in self._stripes.arrays.items():
+            setattr(self, name, array)
+
+    def close(self) -> None:
+        """
+        Stop the processes of split, the grid is stepped in this process again
+        """
+        if self._stripes is not None:
+            for name in FIELDS:
+                setattr(self, name, getattr(self, name).copy())
+            self._stripes.close()
+            self._stripes = None
+
+    @classmethod
+    def window(cls, arrays: dict, cell_keys: np.ndarray, step: int) -> "ArrayGrid":
+        """
+        Get a grid of some rows of a map at a step, given as its state and cell keys,
+        only its frontier can be stepped, see stripes
+        """
+        grid = object.__new__(cls)
+        shape = arrays["types"].shape
+        vars(grid).update(
+            arrays,
+            n_rows=shape[0],
+            n_cols=shape[1],
+            changed=np.zeros(shape, dtype=bool),
+            _dirty=np.zeros(shape, dtype=bool),
+            _cell_keys=cell_keys,
+            _frontier=None,
+            _step=step,
+        )
+        return grid
+
+    def _seed_streams(self):
+        """
+        Also hash the leading words of every cell's infection rolls once
+        """
+        super()._seed_streams()
+        xs, ys = np.indices((self._n, self._m))
+        self._cell_keys = hashes(self._key, INFECTION, xs, ys)
+
+    def ages(self) -> np.ndarray:
+        """
+        Get the ages of all cells, up to date
+        """
+        if self._clock is None:
+            return self.age.copy()
+        return self.age + ((self._step - self._clock) * self.active).astype(np.int32)
+
+    def cell_age(self, x: int, y: int) -> int:
+        """
+        Get the age of a cell, up to date
+        """
+        age = int(self.age[x, y])
+        if self._clock is not None and self.active[x, y]:
+            age += self._step - int(self._clock[x, y])
+        return age
+
+    def type_array(self):
+        """
+        Get the map as an array of integer type codes
+        """
+        return self.types.copy()
+
+    def height_array(self):
+        """
+        Get the map's heights as an array
+        """
+        return self.height.copy()
+
+    def pop_changes(self) -> Changes:
+        """
+        Get the cells whose type or height has changed since the last call (or since
+        the map was set up) and forget about them
+        """
+        x, y = np.nonzero(self._dirty)
+        self._dirty[:] = False
+        return Changes(x, y, self.types[x, y], self.height[x, y])
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Save the full state of the grid, generation can be resumed from it
+        """
+        snapshot.write(
+            path,
+            self._snapshot_meta(),
+            {
+                "types": self.types,
+                "age": self.ages(),
+                "threshold": self.threshold,
+                "height": self.height,
+                "active": self.active,
+            },
+        )
+
+    def _restore(self, meta, arrays):
+        """
+        The arrays stay memory-mapped (copy-on-write) until the map is updated
+        """
+        self._restore_meta(meta)
+        self.types, self.age = arrays["types"], arrays["age"]
+        self.threshold, self.height = arrays["threshold"], arrays["height"]
+        self.active = arrays["active"]
+        shape = (self._n, self._m)
+        self.changed = np.zeros(shape, dtype=bool)
+        self.texture = np.zeros(shape, dtype=bool)
+        self._dirty = np.zeros(shape, dtype=bool)
+        self._map = _CellMap(self)
+        self._step = meta["step"]
+        self._clock = self._frontier = None
+        self._converted, self._growing = 0, False
+
+    def _place(self, coordinates, code):
+        self.types[coordinates] = code
+        self.age[coordinates] = 0
+        self.threshold[coordinates] = THRESHOLDS[code] * self.scaling_coeff
+        self.height[coordinates] = 10
+        self.active[coordinates] = False
+        self._dirty[coordinates] = True
+        self._frontier = None
+
+    def biome_distribution(self):
+        """
+        Secondary biomes distribution
+        """
+        self.destinations[0] = 2
+        stack = list(reversed(RULES.secondary))
+        used = set()
+        rng = Stream(self._key, PLACEMENT, 1)
+        while stack:
+            code = stack.pop()
+            candidates = np.isin(self.types, secondary_codes(CELL_TYPES[code]))
+            if code == SWAMP:
+                candidates &= (self.types != WATER) | shore_water(self.types)
+            for x, y in used:
+                candidates[x, y] = False
+            flat = np.flatnonzero(candidates)
+            if not flat.size:
+                no_candidates(CELL_TYPES[code])
+                continue
+            new = divmod(int(flat[int(rng.random() * len(flat))]), self.n_cols)
+            used.add(new)
+            self._place(new, code)
+
+    def count_coeff(self, cell: "Cell"):
+        """
+        Count the number of neighboring cells of the same type in square 3x3
+        """
+        window = self.types[
+            cell.x - 1 if cell.x >= 1 else 0 : cell.x + 2,
+            cell.y - 1 if cell.y >= 1 else 0 : cell.y + 2,
+        ]
+        return int(np.count_nonzero(window == self.types[cell.x, cell.y]))
+
+    def revert_changed(self, ind):
+        """
+        Revert changed to false, the phase is over once nothing has changed and no land
+        cell can grow any more
+        """
+        if self._frontier is None:
+            self.changed[:] = False
+        if not self._converted and not self._can_grow():
+            self.destinations[ind] = ind + 1
+
+    def _can_grow(self):
+        if self._stripes is not None:
+            return self._growing
+        if self._frontier is None:
+            return can_grow(self.types, self.age, self.threshold)
+        return bool((self.types.reshape(-1)[self._frontier] != WATER).any())
+
+    def _update(self, ind):
+        with self.profiler.phase("update"):
+            visited = self._infect(ind)
+        self.profiler.count("visited", visited)
+        self.profiler.count("changed", self._converted)
+        self._step += 1
+        with self.profiler.phase("revert_changed"):
+            self.revert_changed(ind)
+
+    def _infect(self, ind):
+        """
+        Make a step, returns the number of cells visited
+        """
+        if self._stripes is not None:
+            self._converted, self._growing, visited = self._stripes.step(
+                ind, self._step, self._dirty
+            )
+            for name, array in self._stripes.arrays.items():
+                setattr(self, name, array)
+            return visited
+        if self.FRONTIER:
+            return len(self._infect_frontier(ind)[0])
+        (
+            self.types,
+            self.age,
+            self.threshold,
+            self.height,
+            self.active,
+            self.changed,
+        ) = self._kernel(
+            self.types,
+            self.age,
+            self.threshold,
+            self.height,
+            self.active,
+            self._cell_keys,
+            ind,
+            self._step,
+        )
+        self._dirty |= self.changed
+        self._converted = int(np.count_nonzero(self.changed))
+        return self.types.size
+
+    def _ages(self, cells, step):
+        """
+        Get the ages of cells given as flat indices at a step
+        """
+        active = self.active.reshape(-1)[cells]
+        return (
+            self.age.reshape(-1)[cells]
+            + (step - self._clock.reshape(-1)[cells]) * active
+        )
+
+    def _grown(self, cells, step):
+        """
+        Get the cells of the frontier at a step out of cells given as increasing flat
+        indices
+        """
+        types, threshold = self.types.reshape(-1), self.threshold.reshape(-1)
+        cells = cells[self._ages(cells, step) <= threshold[cells]]
+        return cells[self._grows(types, cells, self.n_rows, self.n_cols)]
+
+    def _infect_frontier(self, ind):
+        """
+        Make a step of the cells of the frontier, same as infect on the whole map,
+        returns the cells of the frontier and the targets they took as flat indices
+        """
+        n, m = self.n_rows, self.n_cols
+        step = self._step
+        if self._clock is None:
+            self._clock = np.full((n, m), step, dtype=np.int64)
+        if self._frontier is None:
+            self._frontier = self._grown(np.arange(n * m), step)
+        cells = self._frontier
+        types, age = self.types.reshape(-1), self.age.reshape(-1)
+        threshold, height = self.threshold.reshape(-1), self.height.reshape(-1)
+        active, clock = self.active.reshape(-1), self._clock.reshape(-1)
+        # Claimed targets, cleared at the end of the step
+        converted = self.changed.reshape(-1)
+
+        # All cells of the frontier are alive
+        source = types[cells]
+        ages = self._ages(cells, step)
+        rolling = RULES.rolls[source]
+        step_keys = np.zeros(len(cells), dtype=np.uint64)
+        step_keys[rolling] = hashes(
+            self._cell_keys.reshape(-1)[cells[rolling]], ind, step
+        )
+        sources, targets, height_rolls = self._claims(
+            types, cells, ages, threshold[cells], step_keys, converted, n, m
+        )
+
+        # Ages of the frontier are brought up to date, the cells that took a target are
+        # active from now on
+        age[cells] = ages
+        clock[cells] = step
+        active[cells[sources]] = True
+        shifted = RULES.rolls_height[source[sources]]
+        height[targets] -= shifted & (height_rolls < 0.2)
+        height[targets] += shifted & (height_rolls > 0.8)
+        types[targets] = source[sources]
+        age[targets] = ages[sources] + 1
+        threshold[targets] = threshold[cells[sources]]
+        active[targets] = True
+        clock[targets] = step + 1
+        converted[targets] = False
+        self._dirty.reshape(-1)[targets] = True
+        self._converted = len(targets)
+
+        around = neighbours(targets, n, m).reshape(-1)
+        candidates = np.unique(np.concatenate([cells, targets, around[around >= 0]]))
+        self._frontier = self._grown(candidates, step + 1)
+        return cells, targets
+
+    def _change_water(self):
+        """
+        Calculate the height of water cells based on their distance to the nearest non-water cell
+        """
+        water = self.types == WATER
+        if water.all():
+            return
+        distance = distance_transform(~water)
+        self.height[water] = 5 - distance[water]
+        self._dirty |= water
@@ -0,0 +1,100 @@
+"""
+Map generation jobs, single maps and process pool batches
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator
+
+from export import save
+from engines import make_grid
+from grid import Grid
+from profiler import Profiler
+from replay import DeltaRecorder
+
+
+def generate(
+    rows: int,
+    cols: int,
+    seed: str | None = None,
+    record: str | None = None,
+    trace: str | None = None,
+    engine: str = "reference",
+    workers: int = 1,
+) -> Grid:
+    """
+    Generate a map with the given engine until all of its phases are over, every step
+    is written to the delta log at the record path and to the JSON lines trace at the
+    trace path if they are given
+    With several workers the map is stepped in stripes by as many processes, see
+    Grid.split, the map is the same
+    """
+    grid = make_grid(engine, rows, cols, seed, workers)
+    if trace is not None:
+        grid.profiler = Profiler(trace=trace)
+    recorder = DeltaRecorder(record, grid) if record is not None else None
+    try:
+        grid.run_to_completion(recorder=recorder)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        grid.profiler.close()
+        grid.close()
+    return grid
+
+
+def output_paths(out_dir: str, seed: str, formats: Iterable[str]) -> list[str]:
+    """
+    Get the output files of a seed
+    """
+    return [os.path.join(out_dir, f"{seed}.{fmt}") for fmt in formats]
+
+
+def _job(
+    rows: int, cols: int, seed: str, paths: list[str], engine: str
+) -> tuple[str, float]:
+    """
+    Generate a single map in a worker process and write it to disk
+    """
+    start = time.perf_counter()
+    grid = generate(rows, cols, seed, engine=engine)
+    for path in paths:
+        save(grid, path)
+    return seed, time.perf_counter() - start
+
+
+def generate_batch(
+    seeds: Iterable[str],
+    rows: int,
+    cols: int,
+    out_dir: str,
+    formats: Iterable[str] = ("npz",),
+    workers: int | None = None,
+    progress_cb: Callable[[int, int, float], None] | None = None,
+    engine: str = "reference",
+) -> Iterator[tuple[str, list[str]]]:
+    """
+    Generate maps for many seeds in a pool of processes, one map per process at a time
+    Every map is written by its worker as soon as it is generated, the results are
+    yielded in order of completion as (seed, output paths)
+    progress_cb is called after every map with (done, total, maps per second)
+    The map of a seed is the same as the one generated by
+    make_grid(engine, rows, cols, seed)
+    """
+    seeds = list(dict.fromkeys(str(seed) for seed in seeds))
+    formats = tuple(formats)
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(
+                _job, rows, cols, seed, output_paths(out_dir, seed, formats), engine
+            ): seed
+            for seed in seeds
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            seed, _ = future.result()
+            if progress_cb is not None:
+                progress_cb(done, len(seeds), done / (time.perf_counter() - start))
+            yield seed, output_paths(out_dir, seed, formats)
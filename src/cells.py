@@ -3,84 +3,134 @@ Map's cells
 """
 
 import random
-from abc import ABC, abstractmethod
 from matplotlib import colors
 
+from rules import RULES
 
-class Cell(ABC):
+# Integer type IDs of the biomes the generation treats on its own, indices in CELL_TYPES
+VOID, WATER, SWAMP = RULES.require("void", "water", "swamp")
+
+
+def type_mask(*type_ids: int) -> int:
     """
-    Cell template class
+    Get the bitmask of a set of type IDs
     """
+    mask = 0
+    for type_id in type_ids:
+        mask |= 1 << type_id
+    return mask
+
+
+class Cell:
+    """
+    Cell template class
+    Data shared by every cell of a type is kept once on its class and taken from the
+    biome of the same name in the rule set, instances only have slots for their own
+    state, so a cell can change its type by changing its class
+    """
+
+    # Subclasses only set TYPE, the name of their biome, the rest of their constants
+    # are set in __init_subclass__: TYPE_ID, BIT (1 << TYPE_ID), COLOR, SUBTYPES,
+    # PROBABILITY, THRESHOLD_AGE, SUBMISSIVE and TARGETS (bitmasks of the types the
+    # cell can be seeded on and can infect), TRANSITIONS (rules of infecting a cell,
+    # by its type ID), ROLLS, ROLLS_HEIGHT and USES_COEFF
+    TYPE = ""
+
+    __slots__ = (
+        "x",
+        "y",
+        "age",
+        "threshold_age",
+        "height",
+        "changed",
+        "active",
+        "texture",
+    )
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        biome = RULES.biomes[RULES.require(cls.TYPE)[0]]
+        cls.TYPE_ID = biome.type_id
+        cls.BIT = 1 << biome.type_id
+        cls.COLOR = biome.color
+        cls.SUBTYPES = biome.subtypes
+        cls.PROBABILITY = biome.texture_probability
+        cls.THRESHOLD_AGE = biome.threshold_age
+        cls.SUBMISSIVE = biome.submissive
+        cls.TARGETS = type_mask(*biome.transitions)
+        cls.TRANSITIONS = biome.transitions
+        cls.ROLLS = biome.rolls
+        cls.ROLLS_HEIGHT = biome.rolls_height
+        cls.USES_COEFF = biome.uses_coeff
 
-    SUBTYPES: dict
-
-    def __init__(
-        self,
-        coordinates: tuple[int, int],
-        age: int = 0,
-        threshold_age: int = 0,
-        type_: str | None = None,
-        color: str | None = None,
-        submissive: list[str] | None = None,
-        probability: float = 0.3,
-    ) -> None:
+    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
         self.x, self.y = coordinates
         self.age = age
-        self.threshold_age = threshold_age
-        self.type = type_
-        self._color = color
-        self.submissive = submissive
-        self.probability = probability
+        self.threshold_age = self.THRESHOLD_AGE
         self.height = 10
         self.changed = False
         self.active = False
         self.texture = False
 
-    def _change_state(self, other: "Cell"):
+    def _change_state(self, other: "Cell", rng=random):
         other.age = self.age + 1
-        ran = random.random()
-        if self.type != "water":
+        if self.ROLLS_HEIGHT:
+            ran = rng.random()
             if ran < 0.2:
                 other.height -= 1
             elif ran > 0.8:
                 other.height += 1
-        other.probability = self.probability
         self.active = True
         other.active = True
         other.__class__ = self.__class__
         other.threshold_age = self.threshold_age
-        other.type = self.type
-        other.submissive = self.submissive
         other.changed = True
-        other.set_color(self._color)
 
-    @abstractmethod
-    def infect(self, other: "Cell") -> None:
+    def can_infect(self, other: "Cell") -> bool:
+        """
+        Whether the cell is able to infect the other one under any conditions
+        """
+        return bool(self.TARGETS & other.BIT)
+
+    def infect(self, other: "Cell", coeff: int = 0, rng=random) -> None:
         """
-        Abstract method for other
+        Infect the other cell if the transition to its type allows it, coeff is the
+        number of same type cells around this one
+        Rolls are taken from rng, at most one before the state is changed
         """
+        rule = self.TRANSITIONS.get(other.TYPE_ID)
+        if rule is None or self.age > self.threshold_age:
+            return
+        chance = rng.random() if rule.roll else 0.0
+        if rule.age_divisor:
+            chance += self.age_coeff / rule.age_divisor
+        if rule.coeff_divisor:
+            chance += coeff**2 / rule.coeff_divisor
+        if chance > rule.above or rule.coeff_range[0] <= coeff < rule.coeff_range[1]:
+            self._change_state(other, rng)
 
-    def get_subtype(self):
+    def get_subtype(self, rng=random):
         """
         Get random subtype
         """
         options = list(self.SUBTYPES.keys())
         probabilities = list(self.SUBTYPES.values())
-        sub = random.choices(options, probabilities)[0]
+        sub = rng.choices(options, probabilities)[0]
         return sub
 
-    def set_color(self, new):
+    @property
+    def type(self) -> str:
         """
-        Set cell's color
+        Cell's type name
         """
-        self._color = new
+        return self.TYPE
 
     @property
     def color(self):
         """
         Calculates the color of the cell based on its type and height
         """
-        rgb = colors.hex2color(self._color)
+        rgb = colors.hex2color(self.COLOR)
         rgb = (
             min(max(rgb[0] + (self.height - 10) / 100, 0), 1),
             min(max(rgb[1] + (self.height - 10) / 100, 0), 1),
@@ -96,7 +146,7 @@ class Cell(ABC):
         return 1 - (self.age / self.threshold_age) if self.age > 3 else 0
 
     def __repr__(self):
-        return f"{self.type} ({self.x}, {self.y})"
+        return f"{self.TYPE} ({self.x}, {self.y})"
 
 
 class Void(Cell):
@@ -105,17 +155,8 @@ class Void(Cell):
     An empty cell that is going to be consumed by water
     """
 
-    SUBTYPES = {"void", 1}
-
-    def __init__(self, coordinates, age=0) -> None:
-        super().__init__(coordinates, age, 30, "void", "#181a1f")
-
-    def infect(self, other: Cell) -> None:
-        """
-        Infect method for void cells
-        Returns nothing because Void can't infect any cell
-        """
-        return None
+    TYPE = "void"
+    __slots__ = ()
 
 
 class Water(Cell):
@@ -124,18 +165,8 @@ class Water(Cell):
     A cell class that represents a certain area filled with water
     """
 
-    SUBTYPES = {"wavy": 0.7, "ship": 0.3}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(coordinates, age, 500, "water", "#1A4480", ["void"], 0.02)
-
-    def infect(self, other: Cell) -> None:
-        """
-        Water cell's infect method
-        Infects only the Void ones with 100% chance
-        """
-        if other.type in self.submissive and self.age <= self.threshold_age:
-            self._change_state(other)
+    TYPE = "water"
+    __slots__ = ()
 
 
 class Plains(Cell):
@@ -144,27 +175,8 @@ class Plains(Cell):
     A cell class that represents an area of plains type
     """
 
-    SUBTYPES = {"grassy": 0.75, "house": 0.05}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(coordinates, age, 39, "plains", "#62bc2f", ["water"], 0.09)
-
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Plain cell's infect method
-        Infects only water cells, with a certain chance + {k} + {age_coeff}, where k = N of
-        the same type cells around the initial one squared divided by 500
-        """
-        if (
-            other.type in self.submissive
-            and random.random() + self.age_coeff / 2 + coeff**2 / 500 > 0.8
-            and self.age <= self.threshold_age
-        ) or (
-            other.type == "desert"
-            and random.random() > 0.95
-            and self.age <= self.threshold_age
-        ):
-            self._change_state(other)
+    TYPE = "plains"
+    __slots__ = ()
 
 
 class Desert(Cell):
@@ -173,28 +185,8 @@ class Desert(Cell):
     A cell class that represents an area of desert type
     """
 
-    SUBTYPES = {"cacti": 0.6, "wasteland": 0.3, "pyramid": 0.1}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(
-            coordinates, age, 27, "desert", "#f6d7b0", ["water"], probability=0.1
-        )
-
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Desert cell's infect method
-        Infects only water cells, either with a ceratin chance + {k}, where k = coeff**2 / 120
-        """
-        if (
-            other.type in self.submissive
-            and random.random() + coeff**2 / 120 > 0.9
-            and self.age <= self.threshold_age
-        ) or (
-            other.type == "plains"
-            and random.random() > 0.95
-            and self.age <= self.threshold_age
-        ):
-            self._change_state(other)
+    TYPE = "desert"
+    __slots__ = ()
 
 
 class Forest(Cell):
@@ -203,23 +195,8 @@ class Forest(Cell):
     A cell class that represents an area of forest type
     """
 
-    SUBTYPES = {"birch": 0.34, "oak": 0.33, "mixed": 0.23, "pine": 0.1}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(coordinates, age, 15, "forest", "#5D9F59", ["plains"], 0.17)
-
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Forest cell's infect method
-        Infects only plains cells with either a certain chance or if there are from 0 to 2 forest
-        cells around the it
-        """
-        if (
-            other.type in self.submissive
-            and (random.random() > 0.7 or coeff in range(0, 3))
-            and self.age <= self.threshold_age
-        ):
-            self._change_state(other)
+    TYPE = "forest"
+    __slots__ = ()
 
 
 class Swamp(Cell):
@@ -228,25 +205,8 @@ class Swamp(Cell):
     A cell class that represents an area of swamp type
     """
 
-    SUBTYPES = {"swamp": 1}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(
-            coordinates, age, 10, "swamp", "#555c45", ["forest", "plains", "water"], 0.4
-        )
-
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Swamp's cell infect method
-        Infects forest, plains and water cells with either a certain chance or if there are from
-        1 to 3 swamp cells around it
-        """
-        if (
-            other.type in self.submissive
-            and (random.random() > 0.9 or coeff in range(1, 3))
-            and self.age <= self.threshold_age
-        ):
-            self._change_state(other)
+    TYPE = "swamp"
+    __slots__ = ()
 
 
 class Snowy(Cell):
@@ -255,31 +215,8 @@ class Snowy(Cell):
     A cell that represents a snowy area
     """
 
-    SUBTYPES = {"snowy": 0.5, "mountain": 0.5}
-
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(
-            coordinates,
-            age,
-            7,
-            "snowy",
-            "#ecfffd",
-            ["forest", "mountain", "plains"],
-            0.11,
-        )
-
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Snowy cell's infect method
-        Infects forest, mountain and plains cells with either a certain chance or if there are from
-        1 to 3 swamp cells around it
-        """
-        if (
-            other.type in self.submissive
-            and self.age <= self.threshold_age
-            and (random.random() > 0.5 or coeff in range(1, 3))
-        ):
-            self._change_state(other)
+    TYPE = "snowy"
+    __slots__ = ()
 
 
 class Mountain(Cell):
@@ -288,18 +225,22 @@ class Mountain(Cell):
     A cell class that represents an area of mountain type
     """
 
-    SUBTYPES = {"peaky": 0.05, "steep": 0.95}
+    TYPE = "mountain"
+    __slots__ = ()
 
-    def __init__(self, coordinates: tuple[int, int], age: int = 0) -> None:
-        super().__init__(coordinates, age, 7, "mountain", "#808080", ["plains"], 0.17)
 
-    def infect(self, other: Cell, coeff: int = 0) -> None:
-        """
-        Mountain cell's infect method
-        """
-        if (
-            other.type in self.submissive
-            and self.age <= self.threshold_age
-            and (coeff in range(1, 3) or random.random() > 0.7)
-        ):
-            self._change_state(other)
+def _cell_type(name: str) -> type:
+    """
+    Get the class of a biome, biomes added in the rules file get one of their own
+    """
+    for cls in (Void, Water, Plains, Desert, Forest, Swamp, Snowy, Mountain):
+        if cls.TYPE == name:
+            return cls
+    return type(
+        name.title(),
+        (Cell,),
+        {"__doc__": f"{name.title()} cell class", "TYPE": name, "__slots__": ()},
+    )
+
+
+CELL_TYPES = tuple(_cell_type(biome.name) for biome in RULES.biomes)
@@ -0,0 +1,284 @@
+"""
+Headless command line interface
+"""
+
+import argparse
+import sys
+import time
+
+from batch import generate, generate_batch
+from conformance import check
+from engines import ENGINES
+from export import save_arrays, save_heightmap, save_png
+from replay import Replay
+
+FORMATS = ("npz", "png")
+# Cells of the smallest map, one per starting biome
+MIN_CELLS = 3
+
+
+def parse_size(text: str) -> tuple[int, int]:
+    """
+    Parse a map size given as COLSxROWS, returns (rows, cols)
+    """
+    try:
+        cols, rows = (int(i) for i in text.lower().split("x"))
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(
+            f"invalid size {text!r}, expected COLSxROWS"
+        ) from err
+    if rows < 1 or cols < 1:
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}, must be positive")
+    if rows * cols < MIN_CELLS:
+        raise argparse.ArgumentTypeError(
+            f"invalid size {text!r}, a map needs at least {MIN_CELLS} cells"
+        )
+    return rows, cols
+
+
+def parse_range(text: str) -> range:
+    """
+    Parse a range of integer seeds given as START:STOP
+    """
+    try:
+        start, stop = (int(i) for i in text.split(":"))
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(
+            f"invalid range {text!r}, expected START:STOP"
+        ) from err
+    return range(start, stop)
+
+
+def _add_size(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--size", type=parse_size, default=(28, 43), help="COLSxROWS, 43x28 by default"
+    )
+
+
+def _add_engine(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="reference",
+        help="simulation engine, reference by default, falls back if it can't run; "
+        "a seed gives the same map only on the same engine, numpy and numba give the "
+        "same maps",
+    )
+
+
+def _add_image(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--scale",
+        type=int,
+        default=1,
+        help="pixels per cell side of .png outputs, 1 by default",
+    )
+    parser.add_argument(
+        "--heightmap", help="also write the heights as a 16-bit grayscale .png"
+    )
+
+
+def _check_image(args, parser) -> None:
+    if args.scale < 1:
+        parser.error("--scale must be at least 1")
+    if args.heightmap is not None and not args.heightmap.endswith(".png"):
+        parser.error(f"the heightmap has to be a .png: {args.heightmap}")
+
+
+def _progress(path: str):
+    """
+    Progress callback of an export, shows the share of the rows written on a terminal
+    """
+    if not sys.stdout.isatty():
+        return None
+    shown = -1
+
+    def report(done, total):
+        nonlocal shown
+        percent = done * 100 // total
+        if percent != shown:
+            shown = percent
+            print(f"\rWriting {path}: {percent}%", end="", flush=True)
+            if done == total:
+                print()
+
+    return report
+
+
+def _write_image(types, height, path, seed, args) -> None:
+    if path.endswith(".png"):
+        save_png(types, height, path, args.scale, _progress(path))
+    else:
+        save_arrays(types, height, path, seed)
+
+
+def _generate(args, parser) -> None:
+    for path in args.out:
+        if not path.endswith(tuple(f".{fmt}" for fmt in FORMATS)):
+            parser.error(f"unsupported output format: {path}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.engine == "reference":
+        parser.error("--workers needs the numpy or numba engine")
+    _check_image(args, parser)
+    start = time.perf_counter()
+    grid = generate(
+        *args.size, args.seed, args.record, args.trace, args.engine, args.workers
+    )
+    elapsed = time.perf_counter() - start
+    types, height = grid.type_array(), grid.height_array()
+    for path in args.out:
+        _write_image(types, height, path, grid.seed, args)
+    if args.heightmap is not None:
+        save_heightmap(height, args.heightmap, args.scale, _progress(args.heightmap))
+    print(
+        f"Seed: {grid.seed}\n"
+        f"Map's size: {grid.n_cols}x{grid.n_rows}\n"
+        f"Engine: {grid.ENGINE}\n"
+        f"Generated in {elapsed:.2f}s"
+    )
+    if args.trace:
+        for name, value in grid.profiler.totals.items():
+            if isinstance(value, float):
+                print(f"{name}: {value:.3f}s")
+            else:
+                print(f"{name}: {value}")
+
+
+def _replay(args, parser) -> None:
+    if not args.out.endswith(tuple(f".{fmt}" for fmt in FORMATS)):
+        parser.error(f"unsupported output format: {args.out}")
+    replay = Replay(args.log)
+    step = replay.steps if args.step is None else args.step
+    if not 0 <= step <= replay.steps:
+        parser.error(f"step {step} is out of range 0..{replay.steps}")
+    _check_image(args, parser)
+    types, height = replay.frame(step)
+    _write_image(types, height, args.out, None, args)
+    if args.heightmap is not None:
+        save_heightmap(height, args.heightmap, args.scale, _progress(args.heightmap))
+    print(f"Step {step} of {replay.steps}")
+
+
+def _batch(args, parser) -> None:
+    seeds = list(args.seeds or []) + [str(i) for i in args.range or []]
+    if not seeds:
+        parser.error("no seeds given, use --seeds and/or --range")
+
+    def report(done, total, rate):
+        print(f"\r{done}/{total} maps, {rate:.2f} maps/s", end="", flush=True)
+
+    start = time.perf_counter()
+    count = 0
+    for count, _ in enumerate(
+        generate_batch(
+            seeds,
+            *args.size,
+            args.out,
+            args.format,
+            args.workers,
+            None if args.quiet else report,
+            args.engine,
+        ),
+        1,
+    ):
+        pass
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        print()
+    print(f"Generated {count} maps in {elapsed:.2f}s, {count / elapsed:.2f} maps/s")
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point of the command line interface
+    """
+    parser = argparse.ArgumentParser(
+        prog="terrain", description="Terrain generation without the UI"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="generate a single map")
+    gen.add_argument("--seed", help="map's seed, random if omitted")
+    _add_size(gen)
+    _add_engine(gen)
+    gen.add_argument(
+        "--out",
+        action="append",
+        required=True,
+        help="output file, .npz or .png, can be given several times",
+    )
+    gen.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes stepping stripes of the map, numpy and numba engines, 1 by"
+        " default",
+    )
+    _add_image(gen)
+    gen.add_argument("--record", help="write every step to this delta log")
+    gen.add_argument(
+        "--trace", help="write the timing and counters of every step to this file"
+    )
+
+    rep = commands.add_parser("replay", help="export a step of a recorded generation")
+    rep.add_argument("--log", required=True, help="delta log written by --record")
+    rep.add_argument("--step", type=int, help="step to export, the last by default")
+    rep.add_argument("--out", required=True, help="output file, .npz or .png")
+    _add_image(rep)
+
+    batch = commands.add_parser("batch", help="generate maps for many seeds")
+    batch.add_argument("--seeds", nargs="+", help="list of seeds")
+    batch.add_argument(
+        "--range", type=parse_range, help="integer seeds START:STOP (exclusive)"
+    )
+    _add_size(batch)
+    _add_engine(batch)
+    batch.add_argument("--out", required=True, help="output directory")
+    batch.add_argument(
+        "--format",
+        action="append",
+        choices=FORMATS,
+        help="output format, can be given several times, npz by default",
+    )
+    batch.add_argument(
+        "--workers", type=int, help="number of processes, all cores by default"
+    )
+    batch.add_argument("--quiet", action="store_true", help="no progress output")
+
+    conf = commands.add_parser(
+        "conformance", help="compare the engines with the reference engine"
+    )
+    conf.add_argument(
+        "--engines",
+        nargs="+",
+        choices=ENGINES,
+        default=[name for name in ENGINES if name != "reference"],
+        help="engines to check, all of them by default",
+    )
+    conf.add_argument(
+        "--sizes",
+        nargs="+",
+        type=parse_size,
+        default=[(28, 43), (100, 100)],
+        help="map sizes as COLSxROWS, 43x28 and 100x100 by default",
+    )
+    conf.add_argument(
+        "--seeds", nargs="+", default=[str(i) for i in range(5)], help="list of seeds"
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        _generate(args, parser)
+    elif args.command == "replay":
+        _replay(args, parser)
+    elif args.command == "batch":
+        args.format = args.format or ["npz"]
+        _batch(args, parser)
+    elif args.command == "conformance":
+        return 0 if check(args.engines, args.sizes, args.seeds) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
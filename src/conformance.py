@@ -0,0 +1,124 @@
+"""
+Conformance of the simulation engines to the reference one
+
+Every engine generates the same seeds and sizes as the reference engine. Engines
+that update cells in another order can't give the same maps, so the maps are
+compared in bulk: the share of the map every biome covers, averaged over the seeds,
+and the phases the generation goes through and how many steps they take. Engines
+that are meant to give exactly the maps of another one are compared cell by cell
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from cells import CELL_TYPES
+from engines import available, make_grid
+
+# Largest difference of a biome's mean share of the map
+COVERAGE_TOLERANCE = 0.05
+# Largest relative difference of a phase's mean number of steps, plus a few steps
+STEPS_TOLERANCE, STEPS_SLACK = 0.25, 2
+# Engines whose maps are the same as the ones of another engine
+EXACT = {"numba": "numpy"}
+
+
+class Run(NamedTuple):
+    """
+    Outcome of a single generation
+    """
+
+    types: np.ndarray
+    height: np.ndarray
+    phases: dict[str, int]
+
+    @property
+    def coverage(self) -> np.ndarray:
+        """
+        Share of the map every cell type covers
+        """
+        counts = np.bincount(self.types.ravel(), minlength=len(CELL_TYPES))
+        return counts / self.types.size
+
+
+def run(engine: str, rows: int, cols: int, seed: str) -> Run:
+    """
+    Generate a map with an engine, counting the steps of every phase
+    """
+    grid = make_grid(engine, rows, cols, seed)
+    phases = {}
+    is_stopped = False
+    while not is_stopped:
+        phase = grid.phase
+        is_stopped = grid.update_grid()
+        phases[phase] = phases.get(phase, 0) + 1
+    return Run(grid.type_array(), grid.height_array(), phases)
+
+
+def compare(engine: str, runs: dict, reference: str = "reference") -> list[str]:
+    """
+    Compare the runs of an engine with the reference engine's ones of the same seeds,
+    runs are keyed by (engine, seed), returns the failures
+    """
+    seeds = [seed for name, seed in runs if name == engine]
+    failures = []
+    for seed in seeds:
+        if list(runs[engine, seed].phases) != list(runs[reference, seed].phases):
+            failures.append(
+                f"seed {seed}: phases {list(runs[engine, seed].phases)}, expected"
+                f" {list(runs[reference, seed].phases)}"
+            )
+    coverage = np.mean([runs[engine, seed].coverage for seed in seeds], axis=0)
+    expected = np.mean([runs[reference, seed].coverage for seed in seeds], axis=0)
+    for cls, share, target in zip(CELL_TYPES, coverage, expected):
+        if abs(share - target) > COVERAGE_TOLERANCE:
+            failures.append(f"{cls.TYPE} covers {share:.1%}, expected {target:.1%}")
+    for phase in runs[reference, seeds[0]].phases:
+        steps = np.mean([runs[engine, seed].phases.get(phase, 0) for seed in seeds])
+        target = np.mean([runs[reference, seed].phases[phase] for seed in seeds])
+        if abs(steps - target) > target * STEPS_TOLERANCE + STEPS_SLACK:
+            failures.append(f"{phase} takes {steps:.1f} steps, expected {target:.1f}")
+    exact = EXACT.get(engine)
+    if exact is not None and (exact, seeds[0]) in runs:
+        for seed in seeds:
+            ours, theirs = runs[engine, seed], runs[exact, seed]
+            if not (
+                np.array_equal(ours.types, theirs.types)
+                and np.array_equal(ours.height, theirs.height)
+            ):
+                failures.append(f"seed {seed}: the map differs from the {exact} one")
+    return failures
+
+
+def check(
+    engines: list[str],
+    sizes: list[tuple[int, int]],
+    seeds: list[str],
+    report=print,
+) -> bool:
+    """
+    Run the engines and the reference engine on every size and seed and compare them,
+    engines that can't run here are skipped
+    Every result is passed to report as a line of text, returns whether all engines
+    conform
+    """
+    ok = True
+    engines = ["reference"] + [name for name in engines if name != "reference"]
+    for name in engines[1:]:
+        if not available(name):
+            report(f"{name}: skipped, not available")
+    engines = [name for name in engines if available(name)]
+    for rows, cols in sizes:
+        runs = {
+            (name, seed): run(name, rows, cols, seed)
+            for name in engines
+            for seed in seeds
+        }
+        for name in engines[1:]:
+            failures = compare(name, runs)
+            ok = ok and not failures
+            status = "ok" if not failures else "FAILED"
+            report(f"{name} {cols}x{rows}: {status}")
+            for failure in failures:
+                report(f"    {failure}")
+    return ok
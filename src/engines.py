@@ -0,0 +1,61 @@
+"""
+Simulation engines
+
+    reference  Grid, a cell object per cell, only the cells that can still grow are
+               visited every step
+    numpy      ArrayGrid, the map as arrays, every step is a few array operations on
+               the cells that can still grow
+    numba      NumbaGrid, the steps of ArrayGrid with the loops over the cells that can
+               still grow compiled with Numba, needs numba
+
+An engine that can't run here falls back to the next one (numba to numpy to
+reference) with a warning, make_grid creates the grid of an engine
+"""
+
+import warnings
+
+from array_grid import ArrayGrid
+from grid import Grid
+import numba_grid
+from numba_grid import NumbaGrid
+
+ENGINES = {cls.ENGINE: cls for cls in (Grid, ArrayGrid, NumbaGrid)}
+FALLBACK = {"numba": "numpy", "numpy": "reference"}
+
+
+def available(name: str) -> bool:
+    """
+    Whether an engine can run here
+    """
+    if name not in ENGINES:
+        raise ValueError(
+            f"unknown engine {name!r}, expected one of {', '.join(ENGINES)}"
+        )
+    return name != "numba" or numba_grid.AVAILABLE
+
+
+def resolve(name: str) -> type:
+    """
+    Get the grid class of an engine, or of the one it falls back to if it can't run
+    here
+    """
+    requested = name
+    while not available(name):
+        name = FALLBACK[name]
+    if name != requested:
+        warnings.warn(
+            f"the {requested} engine is not available, using {name}",
+            RuntimeWarning,
+            stacklevel=3,
+        )
+    return ENGINES[name]
+
+
+def make_grid(
+    engine: str, n: int, m: int, seed: str | None = None, workers: int = 1
+) -> Grid:
+    """
+    Create the grid of an engine, or of the one it falls back to if it can't run here
+    With several workers the map is stepped in stripes, see Grid.split
+    """
+    return resolve(engine)(n, m, seed, workers)
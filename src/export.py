@@ -0,0 +1,188 @@
+"""
+Map export without the UI
+
+PNG images are encoded row by row straight from the map's arrays, a map row is
+scaled up and compressed at a time, so the whole image is never held in memory
+"""
+
+import struct
+import zlib
+from typing import Callable, Iterable
+
+import numpy as np
+
+from cells import CELL_TYPES
+from grid import Grid
+import palette
+
+TYPE_NAMES = tuple(cls.TYPE for cls in CELL_TYPES)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG color types
+GRAYSCALE, RGB = 0, 2
+# Compressed image data is written in chunks of about this many bytes
+CHUNK_SIZE = 1 << 20
+
+
+def save(grid: Grid, path: str, scale: int = 1) -> None:
+    """
+    Save a generated map either as a .npz archive or as a .png image with scale x scale
+    pixels per cell
+    """
+    save_arrays(grid.type_array(), grid.height_array(), path, grid.seed, scale)
+
+
+def save_arrays(
+    types: np.ndarray,
+    height: np.ndarray,
+    path: str,
+    seed: str | None = None,
+    scale: int = 1,
+) -> None:
+    """
+    Save a map given as type codes and heights either as a .npz archive or as a .png
+    image with scale x scale pixels per cell
+    """
+    if path.endswith(".npz"):
+        np.savez_compressed(
+            path,
+            types=types,
+            height=height,
+            type_names=np.array(TYPE_NAMES),
+            seed=np.array(seed or ""),
+        )
+    elif path.endswith(".png"):
+        save_png(types, height, path, scale)
+    else:
+        raise ValueError(f"unsupported output format: {path}")
+
+
+def _chunk(file, kind: bytes, data: bytes) -> None:
+    file.write(struct.pack(">I", len(data)) + kind + data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+
+def write_png(
+    path: str,
+    rows: Iterable[bytes],
+    width: int,
+    height: int,
+    bit_depth: int = 8,
+    color_type: int = RGB,
+    text: dict[str, str] | None = None,
+) -> None:
+    """
+    Write a PNG image given as its rows of raw pixel data, from top to bottom, rows
+    are compressed as they come
+    text is written as tEXt chunks
+    """
+    compressor = zlib.compressobj(6)
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE)
+        _chunk(
+            file,
+            b"IHDR",
+            struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0),
+        )
+        for key, value in (text or {}).items():
+            _chunk(file, b"tEXt", f"{key}\0{value}".encode("latin-1"))
+        pending = []
+        size = 0
+        for row in rows:
+            # Every row starts with its filter type, 0 is none
+            data = compressor.compress(b"\0" + row)
+            if data:
+                pending.append(data)
+                size += len(data)
+            if size >= CHUNK_SIZE:
+                _chunk(file, b"IDAT", b"".join(pending))
+                pending, size = [], 0
+        pending.append(compressor.flush())
+        _chunk(file, b"IDAT", b"".join(pending))
+        _chunk(file, b"IEND", b"")
+
+
+def _scaled_rows(
+    pixels: Callable[[int], np.ndarray],
+    n_rows: int,
+    scale: int,
+    progress_cb: Callable[[int, int], None] | None,
+    overlay: Callable[[int, np.ndarray], np.ndarray] | None = None,
+) -> Iterable[bytes]:
+    """
+    Rows of an image with scale x scale pixels per cell, pixels(i) gets the pixels of
+    the cells of the map's row i, overlay(i, block) the scale rows of pixels drawn for
+    it to draw over them
+    """
+    for i in range(n_rows):
+        row = np.repeat(pixels(i), scale, axis=0)
+        if overlay is None:
+            row = row.tobytes()
+            for _ in range(scale):
+                yield row
+        else:
+            for line in overlay(i, np.repeat(row[None], scale, axis=0)):
+                yield line.tobytes()
+        if progress_cb is not None:
+            progress_cb(i + 1, n_rows)
+
+
+def save_png(
+    types: np.ndarray,
+    height: np.ndarray,
+    path: str,
+    scale: int = 1,
+    progress_cb: Callable[[int, int], None] | None = None,
+    overlay: Callable[[int, np.ndarray], np.ndarray] | None = None,
+) -> None:
+    """
+    Save the map's colors as an 8-bit RGB PNG with scale x scale pixels per cell
+    progress_cb is called after every row of the map with (done, total)
+    overlay(i, block) is given the (scale, width, 3) pixels of the map's row i and
+    returns them with whatever it draws over them, such as textures
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    n_rows, n_cols = types.shape
+    write_png(
+        path,
+        _scaled_rows(
+            lambda i: palette.to_rgb(types[i], height[i]),
+            n_rows,
+            scale,
+            progress_cb,
+            overlay,
+        ),
+        n_cols * scale,
+        n_rows * scale,
+    )
+
+
+def save_heightmap(
+    height: np.ndarray,
+    path: str,
+    scale: int = 1,
+    progress_cb: Callable[[int, int], None] | None = None,
+) -> None:
+    """
+    Save the cells' heights as a 16-bit grayscale PNG with scale x scale pixels per
+    cell, the lowest height of the map is black and the highest one white
+    The heights of black and white are written as the height_min and height_max text
+    chunks
+    progress_cb is called after every row of the map with (done, total)
+    """
+    n_rows, n_cols = height.shape
+    low, high = float(height.min()), float(height.max())
+    step = (high - low) / 65535 or 1
+
+    def pixels(i):
+        return np.round((height[i] - low) / step).astype(">u2")
+
+    write_png(
+        path,
+        _scaled_rows(pixels, n_rows, scale, progress_cb),
+        n_cols * scale,
+        n_rows * scale,
+        bit_depth=16,
+        color_type=GRAYSCALE,
+        text={"height_min": repr(low), "height_max": repr(high)},
+    )
@@ -3,23 +3,241 @@ Map/grid class
 """
 
 import random
+import time
+import warnings
+from typing import Callable, NamedTuple
+
 import numpy as np
 
-from cells import Cell, Void, Water, Plains, Desert, Forest, Mountain, Swamp, Snowy
+from cells import (
+    Cell,
+    Void,
+    CELL_TYPES,
+    WATER,
+    SWAMP,
+)
+import snapshot
+from profiler import Profiler
+from rules import RULES
+from rng import GENERATION, INFECTION, PLACEMENT, TEXTURES, Stream, fold, stream_key
+
+# Neighbour directions of get_neighbours, rolls are keyed by their index
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class Changes(NamedTuple):
+    """
+    Cells whose type or height has changed, their coordinates, type codes and heights
+    """
+
+    x: np.ndarray
+    y: np.ndarray
+    types: np.ndarray
+    height: np.ndarray
+
+
+def _intersection(f, q, rows, vk):
+    """
+    Column where the parabola of column q of the given rows meets the one of column vk
+    """
+    return (f[rows, q] + q * q - f[rows, vk] - vk * vk) / (2 * (q - vk))
+
+
+def distance_transform(mask: np.ndarray) -> np.ndarray:
+    """
+    Exact Euclidean distance from every cell to the nearest True cell of the mask
+    Two separable passes (Felzenszwalb & Huttenlocher), linear in the number of cells:
+    distances along the columns first, then the lower envelope of parabolas along the
+    rows, the latter is done for all rows at once
+    Returns inf for every cell if the mask has no True cells
+    """
+    n, m = mask.shape
+    if not mask.any():
+        return np.full(mask.shape, np.inf)
+    big = float(n + m) ** 4
+    column = np.where(mask[0], 0.0, big)
+    vertical = np.empty(mask.shape)
+    vertical[0] = column
+    for i in range(1, n):
+        column = np.where(mask[i], 0.0, column + 1)
+        vertical[i] = column
+    for i in range(n - 2, -1, -1):
+        np.minimum(vertical[i], vertical[i + 1] + 1, out=vertical[i])
+    f = np.where(vertical >= big, big, vertical**2)
+
+    rows = np.arange(n)
+    k = np.zeros(n, dtype=np.intp)
+    v = np.zeros((n, m), dtype=np.intp)
+    z = np.empty((n, m + 1))
+    z[:, 0] = -np.inf
+    z[:, 1] = np.inf
+    for q in range(1, m):
+        s = _intersection(f, q, rows, v[rows, k])
+        pop = s <= z[rows, k]
+        while pop.any():
+            k[pop] -= 1
+            s[pop] = _intersection(f, q, rows[pop], v[rows[pop], k[pop]])
+            pop &= s <= z[rows, k]
+        k += 1
+        v[rows, k] = q
+        z[rows, k] = s
+        z[rows, k + 1] = np.inf
+
+    squared = np.empty((n, m))
+    k[:] = 0
+    for j in range(m):
+        ahead = z[rows, k + 1] < j
+        while ahead.any():
+            k[ahead] += 1
+            ahead &= z[rows, k + 1] < j
+        vk = v[rows, k]
+        squared[:, j] = (j - vk) ** 2 + f[rows, vk]
+    return np.sqrt(squared)
+
+
+def starting_biomes(
+    rng, n_rows: int, n_cols: int
+) -> list[tuple[tuple[int, int], type]]:
+    """
+    Draw the distinct cells of the starting biomes of a map with the given bounds,
+    returns their coordinates and classes
+    """
+    res = []
+    used = set()
+    stack = [CELL_TYPES[type_id] for type_id in reversed(RULES.starting)]
+    if n_rows * n_cols < len(stack):
+        raise ValueError(
+            f"a {n_rows}x{n_cols} map can't hold its {len(stack)} starting biomes"
+        )
+    while stack:
+        new = (rng.randint(0, n_rows - 1), rng.randint(0, n_cols - 1))
+        if new in used:
+            continue
+        used.add(new)
+        res.append((new, stack.pop()))
+    return res
+
+
+def shore_water(types: np.ndarray) -> np.ndarray:
+    """
+    Get a mask of the water cells that have a neighbour of another type, the only water
+    cells a swamp can start on
+    """
+    water = types == WATER
+    padded = np.pad(water, 1, constant_values=True)
+    inland = padded[2:, 1:-1] & padded[:-2, 1:-1] & padded[1:-1, 2:] & padded[1:-1, :-2]
+    return water & ~inland
+
+
+def secondary_codes(seed: "Cell") -> list[int]:
+    """
+    Get the type codes of the cells a secondary biome seed can be placed on
+    """
+    return [cls.TYPE_ID for cls in CELL_TYPES if seed.SUBMISSIVE & cls.BIT]
+
+
+def no_candidates(seed: "Cell") -> None:
+    """
+    Report a secondary biome that has no cell to start on
+    """
+    warnings.warn(
+        f"no cell can take a {seed.TYPE} seed, the biome is skipped",
+        RuntimeWarning,
+        stacklevel=3,
+    )
+
+
+class CellIndex:
+    """
+    Set of cells' coordinates that are added, removed and drawn by position in O(1),
+    a removed cell's place is taken by the last one
+    """
+
+    def __init__(self, cells=()) -> None:
+        self._cells: list[tuple[int, int]] = []
+        self._positions: dict[tuple[int, int], int] = {}
+        for cell in cells:
+            self.add(cell)
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def __contains__(self, cell) -> bool:
+        return cell in self._positions
+
+    def __getitem__(self, position: int) -> tuple[int, int]:
+        return self._cells[position]
+
+    def add(self, cell: tuple[int, int]) -> None:
+        """
+        Add a cell, nothing happens if it's already there
+        """
+        if cell not in self._positions:
+            self._positions[cell] = len(self._cells)
+            self._cells.append(cell)
+
+    def discard(self, cell: tuple[int, int]) -> None:
+        """
+        Remove a cell, nothing happens if it isn't there
+        """
+        position = self._positions.pop(cell, None)
+        if position is None:
+            return
+        last = self._cells.pop()
+        if position < len(self._cells):
+            self._cells[position] = last
+            self._positions[last] = position
+
+
+def _coordinates(mask: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Get the coordinates of the cells of a mask, in row-major order
+    """
+    return [(int(x), int(y)) for x, y in np.argwhere(mask)]
+
+
+def _flat(indexes: list[CellIndex], m: int) -> np.ndarray:
+    """
+    Get the flat indices of the cells of indexes, in their order
+    """
+    return np.array([x * m + y for index in indexes for x, y in index], dtype=np.int64)
+
+
+def _unflat(flat: np.ndarray, m: int) -> list[tuple[int, int]]:
+    """
+    Get the coordinates of cells given by their flat indices
+    """
+    return [divmod(int(i), m) for i in flat]
+
+
+def _pick(indexes: list[CellIndex], position: int) -> tuple[int, int]:
+    """
+    Get the cell at a position of the indexes put one after another
+    """
+    for index in indexes:
+        if position < len(index):
+            return index[position]
+        position -= len(index)
+    raise IndexError(position)
 
 
 class Grid:
     """
-    Grid class
+    Grid class, the reference engine, engines.make_grid creates the grid of any engine
     """
 
-    def __init__(self, n: int, m: int, seed: str | None = None) -> None:
+    ENGINE = "reference"
+
+    def __init__(
+        self, n: int, m: int, seed: str | None = None, workers: int = 1
+    ) -> None:
         self.n_rows = n
         self.n_cols = m
         self._n = n
         self._m = m
         self.seed = seed if seed else self.generate_seed()
         self.destinations = [0, 0]
+        self.profiler = Profiler()
         self.scaling_coeff = (n * m) / (43 * 28)
         if self.scaling_coeff < 0.8:
             self.scaling_coeff += (1 - self.scaling_coeff) / ((self._n + self._m) / 10)
@@ -27,12 +245,22 @@ class Grid:
             self.scaling_coeff -= (self.scaling_coeff) / (
                 (self._n + self._m) / 10
             ) ** 0.2
+        # Random streams, see _seed_streams
+        self._key = self.texture_rng = None
+        # Neighbour counts, cells of every type, shore water, age clocks and the
+        # frontier of the map, see _index
+        self._coeffs = self._cells_of = self._shore = None
+        self._step = 0
+        self._clock = self._changed_cells = self._frontier = None
         self.set_up()
+        if workers > 1:
+            self.split(workers)
 
     def __getitem__(self, i):
         return self._map[i]
 
-    def generate_seed(self):
+    @staticmethod
+    def generate_seed():
         """
         Generate a random seed string for the grid
         """
@@ -42,6 +270,18 @@ class Grid:
             seed += random.choice(seed_chars)
         return seed
 
+    def split(self, workers: int) -> None:
+        """
+        Step the map in stripes, one process per stripe, the maps are the same for any
+        number of workers
+        """
+        raise ValueError(f"the {self.ENGINE} engine can't split the map")
+
+    def close(self) -> None:
+        """
+        Stop the processes of split, the grid is stepped in this process again
+        """
+
     def change_generation_size(self, rows, cols):
         """
         Change grid's size
@@ -52,79 +292,288 @@ class Grid:
         """
         Set the map up
         """
-        random.seed(self.seed)
+        self._seed_streams()
         self.n_rows, self.n_cols = self._n, self._m
         self._map = np.array(
             [[Void((i, j), 0) for j in range(self._m)] for i in range(self._n)]
         )
         used = set()
-        stack = [Water, Plains, Desert]
-        while stack:
-            new = (
-                random.randint(0, self.n_rows - 1),
-                random.randint(0, self.n_cols - 1),
-            )
-            if new in used:
-                continue
+        for new, cls in self.initial_biomes(Stream(self._key, PLACEMENT, 0)):
             used.add(new)
-            self._map[new[0]][new[1]] = stack.pop()(new)
+            self._map[new[0]][new[1]] = cls(new)
             self._map[new[0]][new[1]].threshold_age *= self.scaling_coeff
+        self._index(0, used)
+        self._dirty = set(used)
+
+    def _seed_streams(self):
+        """
+        Derive the keys of the generation's and the textures' random streams from the
+        seed, the textures' stream is independent from the generation
+        """
+        self._key = stream_key(self.seed, GENERATION)
+        self.texture_rng = Stream(stream_key(self.seed, TEXTURES))
+
+    def _index(self, step, candidates):
+        """
+        Build neighbour counts, age clocks and the frontier of the current map
+        """
+        self._coeffs = np.array(
+            [[self._count_window(cell) for cell in row] for row in self._map],
+            dtype=np.int8,
+        )
+        types = self.type_array()
+        self._cells_of = [
+            CellIndex(_coordinates(types == code)) for code in range(len(CELL_TYPES))
+        ]
+        self._shore = CellIndex(_coordinates(shore_water(types)))
+        self._step = step
+        self._clock = np.full((self._n, self._m), step, dtype=np.int64)
+        self._changed_cells = []
+        self._frontier = set()
+        self._refresh_frontier(candidates)
+
+    def _snapshot_meta(self):
+        return {
+            "engine": type(self).__name__,
+            "n_rows": self.n_rows,
+            "n_cols": self.n_cols,
+            "seed": self.seed,
+            "destinations": list(self.destinations),
+            "scaling_coeff": self.scaling_coeff,
+            "step": self._step,
+        }
+
+    def _restore_meta(self, meta):
+        if meta["engine"] != type(self).__name__:
+            raise ValueError(
+                f"snapshot of a {meta['engine']} can't be loaded as a {type(self).__name__}"
+            )
+        self.n_rows = self._n = meta["n_rows"]
+        self.n_cols = self._m = meta["n_cols"]
+        self.seed = meta["seed"]
+        self.destinations = list(meta["destinations"])
+        self._seed_streams()
+        self.scaling_coeff = meta["scaling_coeff"]
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Save the full state of the grid, generation can be resumed from it
+        """
+        for row in self._map:
+            for cell in row:
+                self._sync_age(cell)
+        snapshot.write(
+            path,
+            self._snapshot_meta(),
+            {
+                "types": self.type_array(),
+                "age": np.array(
+                    [[cell.age for cell in row] for row in self._map], dtype=np.int64
+                ),
+                "threshold": np.array(
+                    [[cell.threshold_age for cell in row] for row in self._map],
+                    dtype=float,
+                ),
+                "height": self.height_array(),
+                "active": np.array(
+                    [[cell.active for cell in row] for row in self._map], dtype=bool
+                ),
+                # Secondary biomes are drawn by position in the indexes, whose order
+                # depends on how the map got there
+                "cell_order": _flat(self._cells_of, self._m),
+                "shore_order": _flat([self._shore], self._m),
+            },
+        )
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "Grid":
+        """
+        Load a grid saved with save_snapshot
+        """
+        meta, arrays = snapshot.read(path)
+        grid = cls.__new__(cls)
+        grid.profiler = Profiler()
+        grid._restore(meta, arrays)  # pylint: disable=protected-access
+        return grid
+
+    def _restore(self, meta, arrays):
+        self._restore_meta(meta)
+        types, age, threshold = arrays["types"], arrays["age"], arrays["threshold"]
+        height, active = arrays["height"], arrays["active"]
+        self._map = np.empty((self._n, self._m), dtype=object)
+        for i in range(self._n):
+            for j in range(self._m):
+                cell = CELL_TYPES[types[i, j]]((i, j), int(age[i, j]))
+                cell.threshold_age = float(threshold[i, j])
+                cell.height = float(height[i, j])
+                cell.active = bool(active[i, j])
+                self._map[i][j] = cell
+        self._index(
+            meta["step"], [(i, j) for i in range(self._n) for j in range(self._m)]
+        )
+        counts = np.bincount(types.ravel(), minlength=len(CELL_TYPES))
+        self._cells_of = [
+            CellIndex(_unflat(flat, self._m))
+            for flat in np.split(arrays["cell_order"], np.cumsum(counts)[:-1])
+        ]
+        self._shore = CellIndex(_unflat(arrays["shore_order"], self._m))
+        self._dirty = set()
+
+    def initial_biomes(self, rng=random):
+        """
+        Get coordinates and classes of the starting biome cells
+        """
+        return starting_biomes(rng, self.n_rows, self.n_cols)
 
     def biome_distribution(self):
         """
         Secondary biomes distribution
         """
         self.destinations[0] = 2
-        stack = [Forest, Mountain, Swamp, Snowy]
+        stack = [CELL_TYPES[type_id] for type_id in reversed(RULES.secondary)]
         used = set()
+        rng = Stream(self._key, PLACEMENT, 1)
         while stack:
             curr = stack.pop()((-1, -1))
-            while 1:
-                new = (
-                    random.randint(0, self.n_rows - 1),
-                    random.randint(0, self.n_cols - 1),
-                )
-                if new in used or self._map[new[0]][new[1]].type not in curr.submissive:
-                    continue
-                if (
-                    curr.type == "swamp"
-                    and self._map[new[0]][new[1]].type == "water"
-                    and not [
-                        i
-                        for i in self.get_neighbours(self._map[new[0]][new[1]])
-                        if i.type != "water"
-                    ]
-                ):
-                    continue
-                curr.x, curr.y = new
-                used.add(new)
-                self._map[new[0]][new[1]] = curr
-                self._map[new[0]][new[1]].threshold_age *= self.scaling_coeff
-                break
+            new = self._draw(curr, used, rng)
+            if new is None:
+                no_candidates(curr)
+                continue
+            curr.x, curr.y = new
+            used.add(new)
+            old = type(self._map[new[0]][new[1]])
+            self._map[new[0]][new[1]] = curr
+            self._map[new[0]][new[1]].threshold_age *= self.scaling_coeff
+            self._update_coeffs(curr, old)
+            self._clock[new] = self._step
+            self._dirty.add(new)
+        self._refresh_frontier(self._frontier | self._around(used))
+
+    def _draw(self, seed, used, rng):
+        """
+        Draw the cell a secondary biome seed starts on, uniformly from all of the cells
+        it can be placed on, None if there is none
+        The cells are taken from the per-type indexes, and from the shore ones for the
+        water a swamp starts on, a draw that hits a used cell is made again
+        """
+        codes = secondary_codes(seed)
+        indexes = [
+            (
+                self._shore
+                if code == WATER and seed.TYPE_ID == SWAMP
+                else self._cells_of[code]
+            )
+            for code in codes
+        ]
+        total = sum(len(index) for index in indexes)
+        if total == sum(cell in index for cell in used for index in indexes):
+            return None
+        while True:
+            new = _pick(indexes, int(rng.random() * total))
+            if new not in used:
+                return new
+
+    def type_array(self):
+        """
+        Get the map as an array of integer type codes, indices in cells.CELL_TYPES
+        """
+        return np.array(
+            [[cell.TYPE_ID for cell in row] for row in self._map],
+            dtype=np.uint8,
+        )
+
+    def height_array(self):
+        """
+        Get the map's heights as an array
+        """
+        return np.array(
+            [[cell.height for cell in row] for row in self._map], dtype=float
+        )
+
+    def pop_changes(self) -> Changes:
+        """
+        Get the cells whose type or height has changed since the last call (or since
+        the map was set up) and forget about them
+        """
+        cells = [self._map[x][y] for x, y in sorted(self._dirty)]
+        self._dirty = set()
+        return Changes(
+            np.array([cell.x for cell in cells], dtype=np.intp),
+            np.array([cell.y for cell in cells], dtype=np.intp),
+            np.array([cell.TYPE_ID for cell in cells], dtype=np.uint8),
+            np.array([cell.height for cell in cells], dtype=float),
+        )
 
     def count_coeff(self, cell: "Cell"):
         """
-        Count the number of neighboring cells of the same type in square 3x3
+        Get the number of neighboring cells of the same type in square 3x3
         """
-        counter = 0
-        for neighbour in np.ravel(
+        return int(self._coeffs[cell.x, cell.y])
+
+    def _window(self, cell: "Cell"):
+        return np.ravel(
             self._map[
                 cell.x - 1 if cell.x >= 1 else 0 : cell.x + 2,
                 cell.y - 1 if cell.y >= 1 else 0 : cell.y + 2,
             ]
-        ):
+        )
+
+    def _count_window(self, cell: "Cell"):
+        """
+        Count the number of neighboring cells of the same type in square 3x3
+        """
+        counter = 0
+        for neighbour in self._window(cell):
             if type(neighbour) is type(cell):
                 counter += 1
         return counter
 
+    def _update_coeffs(self, cell: "Cell", old: type):
+        """
+        Update the same type counts around a cell that has changed its type from old,
+        and the indexes of the cells of both types
+        """
+        if type(cell) is old:
+            return
+        self._cells_of[old.TYPE_ID].discard((cell.x, cell.y))
+        self._cells_of[cell.TYPE_ID].add((cell.x, cell.y))
+        if WATER in (old.TYPE_ID, cell.TYPE_ID):
+            self._update_shore(cell)
+        for neighbour in self._window(cell):
+            if neighbour is cell:
+                continue
+            if type(neighbour) is old:
+                self._coeffs[neighbour.x, neighbour.y] -= 1
+            elif type(neighbour) is type(cell):
+                self._coeffs[neighbour.x, neighbour.y] += 1
+        self._coeffs[cell.x, cell.y] = self._count_window(cell)
+
+    def _update_shore(self, cell: "Cell"):
+        """
+        Update the shore water index around a cell that has become or stopped being
+        water, same cells as shore_water
+        """
+        for i, j in ((0, 0),) + NEIGHBOURS:
+            x, y = cell.x + i, cell.y + j
+            if not (0 <= x < self.n_rows and 0 <= y < self.n_cols):
+                continue
+            if self._map[x][y].TYPE_ID == WATER and any(
+                0 <= x + k < self.n_rows
+                and 0 <= y + l < self.n_cols
+                and self._map[x + k][y + l].TYPE_ID != WATER
+                for k, l in NEIGHBOURS
+            ):
+                self._shore.add((x, y))
+            else:
+                self._shore.discard((x, y))
+
     def get_neighbours(self, cell: "Cell"):
         """
         Get neighboring cells of a given cell from top, left, right and below
         """
-        neighbors = [(1, 0), (-1, 0), (0, 1), (0, -1)]
         res = [
             self._map[cell.x + i][cell.y + j]
-            for i, j in neighbors
+            for i, j in NEIGHBOURS
             if cell.x + i not in [-1, self.n_rows]
             and cell.y + j not in [-1, self.n_cols]
         ]
@@ -153,23 +602,57 @@ class Grid:
             for i, j in adj
             if cell.x + i != self.n_rows
             and cell.y + j != self.n_cols
-            and self._map[cell.x + i][cell.y + j].type == cell.type
+            and self._map[cell.x + i][cell.y + j].TYPE_ID == cell.TYPE_ID
         ]
         return len(res) == 3
 
+    def _around(self, coordinates):
+        """
+        Get the given coordinates together with their neighbours' ones
+        """
+        res = set(coordinates)
+        for x, y in coordinates:
+            res.update((n.x, n.y) for n in self.get_neighbours(self._map[x][y]))
+        return res
+
+    def _sync_age(self, cell: "Cell"):
+        """
+        Bring the age of a cell up to date, active cells age by one every step
+        """
+        if cell.active:
+            cell.age += self._step - int(self._clock[cell.x, cell.y])
+        self._clock[cell.x, cell.y] = self._step
+
+    def _can_grow(self, cell: "Cell"):
+        """
+        Whether a cell is young enough and has a neighbour it can infect
+        """
+        self._sync_age(cell)
+        return cell.age <= cell.threshold_age and any(
+            cell.can_infect(neighbour) for neighbour in self.get_neighbours(cell)
+        )
+
+    def _refresh_frontier(self, candidates):
+        """
+        Keep only the cells that are still able to infect something
+        """
+        self._frontier = {
+            (x, y) for x, y in candidates if self._can_grow(self._map[x][y])
+        }
+
     def revert_changed(self, ind):
         """
-        Revert changed to false
+        Revert changed to false, the phase is over once the frontier is empty
         """
-        flag = False
-        for row in self._map:
-            for cell in row:
-                if cell.changed:
-                    cell.changed = False
-                    flag = True
-                if cell.type != "water" and cell.age <= cell.threshold_age:
-                    flag = True
-        if not flag:
+        candidates = self._frontier | self._around(
+            [(cell.x, cell.y) for cell in self._changed_cells]
+        )
+        for cell in self._changed_cells:
+            cell.changed = False
+        self._changed_cells = []
+        self._step += 1
+        self._refresh_frontier(candidates)
+        if not self._frontier:
             self.destinations[ind] = ind + 1
 
     def update_grid(self):
@@ -177,53 +660,111 @@ class Grid:
         Walks through the grid and updates its' cells according to its rules
         """
         if self.destinations[1]:
-            self._change_water()
+            with self.profiler.phase("change_water"):
+                self._change_water()
             return True
         if self.destinations[0] == 1:
-            self.biome_distribution()
+            with self.profiler.phase("biome_distribution"):
+                self.biome_distribution()
         if not self.destinations[0]:
             self._update(0)
         else:
             self._update(1)
         return False
 
+    @property
+    def step(self) -> int:
+        """
+        Number of steps made so far
+        """
+        return self._step
+
+    @property
+    def phase(self) -> str:
+        """
+        Name of the current phase of the generation
+        """
+        if self.destinations[1]:
+            return "water"
+        return "land" if not self.destinations[0] else "biomes"
+
+    def run_to_completion(
+        self,
+        progress_cb: Callable[[str, int], None] | None = None,
+        recorder=None,
+        interval: float = 0.1,
+        cancelled: Callable[[], bool] | None = None,
+    ) -> int:
+        """
+        Run the generation through all of its phases without rendering anything,
+        returns the number of steps made
+        progress_cb(phase, step) is called at most every interval seconds and once the
+        map is done, every step is written to the delta recorder if one is given
+        The run stops early, between two steps, once cancelled() is true
+        """
+        if recorder is not None:
+            self.pop_changes()
+        steps = 0
+        last = time.perf_counter()
+        is_stopped = False
+        while not is_stopped:
+            if cancelled is not None and cancelled():
+                break
+            is_stopped = self.update_grid()
+            self.profiler.end_step(self.step, self.phase)
+            steps += 1
+            if recorder is not None:
+                recorder.record(self.pop_changes())
+            if progress_cb is not None and time.perf_counter() - last >= interval:
+                progress_cb(self.phase, steps)
+                last = time.perf_counter()
+        if progress_cb is not None:
+            progress_cb(self.phase, steps)
+        return steps
+
     def _update(self, ind):
-        for row in self._map:
-            for cell in row:
+        with self.profiler.phase("update"):
+            for x, y in sorted(self._frontier):
+                cell = self._map[x][y]
                 if cell.changed:
                     continue
-                coeff = (
-                    None
-                    if cell.type in ["water", "void", "swamp"]
-                    else self.count_coeff(cell)
+                self._sync_age(cell)
+                coeff = self.count_coeff(cell) if cell.USES_COEFF else 0
+                cell_key = (
+                    fold(self._key, INFECTION, x, y, ind, self._step)
+                    if cell.ROLLS
+                    else None
                 )
-                for neighbour in self.get_neighbours(cell):
-                    if not neighbour.changed and coeff is not None:
-                        cell.infect(neighbour, coeff)
-                    elif not neighbour.changed:
-                        cell.infect(neighbour)
+                for direction, (i, j) in enumerate(NEIGHBOURS):
+                    if not (0 <= x + i < self.n_rows and 0 <= y + j < self.n_cols):
+                        continue
+                    neighbour = self._map[x + i][y + j]
+                    if neighbour.changed:
+                        continue
+                    old = type(neighbour)
+                    rolls = random if cell_key is None else Stream(cell_key, direction)
+                    cell.infect(neighbour, coeff, rng=rolls)
+                    if neighbour.changed:
+                        self._changed_cells.append(neighbour)
+                        self._dirty.add((neighbour.x, neighbour.y))
+                        self._update_coeffs(neighbour, old)
+                        self._clock[neighbour.x, neighbour.y] = self._step + 1
                 if cell.active:
                     cell.age += 1
-        self.revert_changed(ind)
+                    self._clock[x, y] = self._step + 1
+        self.profiler.count("visited", len(self._frontier))
+        self.profiler.count("changed", len(self._changed_cells))
+        with self.profiler.phase("revert_changed"):
+            self.revert_changed(ind)
 
     def _change_water(self):
         """
         Calculate the height of water cells based on their distance to the nearest non-water cell
         """
-        set_water = set()
-        set_not_water = set()
-        for row in self._map:
-            for cell in row:
-                if cell.type != "water":
-                    set_not_water.add((cell.x, cell.y))
-        for row in self._map:
-            for cell in row:
-                if cell.type == "water":
-                    dis_set = set()
-                    for el in set_not_water:
-                        dis_set.add(
-                            (abs(el[0] - cell.x) ** 2 + abs(el[1] - cell.y) ** 2)
-                            ** (1 / 2)
-                        )
-                    set_water.add((cell, min(dis_set)))
-                    cell.height = 5 - min(dis_set)
+        land = np.array([[cell.TYPE_ID != WATER for cell in row] for row in self._map])
+        if not land.any():
+            return
+        distance = distance_transform(land)
+        for x, y in np.argwhere(~land):
+            self._map[x][y].height = 5 - float(distance[x, y])
+            self._dirty.add((x, y))
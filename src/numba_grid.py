@@ -0,0 +1,168 @@
+"""
+Vectorized map/grid class compiled with Numba
+"""
+
+import numpy as np
+
+from array_grid import DIRECTIONS, ArrayGrid
+from rules import RULES
+from rng import _GAMMA, _M1, _M2
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+_DIRECTIONS = np.array(DIRECTIONS, dtype=np.int64)
+
+
+def _fold(key, word):
+    # rng.fold of a single word, on np.uint64
+    z = key + np.uint64(word) + np.uint64(_GAMMA)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(_M1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(_M2)
+    return z ^ (z >> np.uint64(31))
+
+
+def _unit(h):
+    # rng.to_unit of a single hash
+    return np.float64(h >> np.uint64(11)) * 2.0**-53
+
+
+def _grows(types, cells, n, m, directions, allowed):
+    """
+    array_grid.grows as loops
+    """
+    res = np.zeros(len(cells), dtype=np.bool_)
+    for k, cell in enumerate(cells):
+        i, j = cell // m, cell % m
+        for index in range(directions.shape[0]):
+            x, y = i + directions[index, 0], j + directions[index, 1]
+            if 0 <= x < n and 0 <= y < m and allowed[types[cell], types[x * m + y]]:
+                res[k] = True
+                break
+    return res
+
+
+def _claims(
+    types,
+    cells,
+    ages,
+    thresholds,
+    step_keys,
+    converted,
+    n,
+    m,
+    directions,
+    rolls,
+    uses_coeff,
+    allowed,
+    above,
+    age_divisor,
+    coeff_divisor,
+    coeff_low,
+    coeff_high,
+):
+    """
+    array_grid.claims as loops, only the rolls of the pairs whose rules are evaluated
+    are hashed
+    """
+    coeff = np.zeros(len(cells), dtype=np.int64)
+    age_coeff = np.zeros(len(cells))
+    for k, cell in enumerate(cells):
+        i, j = cell // m, cell % m
+        own = types[cell]
+        if uses_coeff[own]:
+            for x in range(max(i - 1, 0), min(i + 2, n)):
+                for y in range(max(j - 1, 0), min(j + 2, m)):
+                    coeff[k] += types[x * m + y] == own
+        if ages[k] > 3:
+            age_coeff[k] = 1 - ages[k] / thresholds[k]
+    size = min(len(cells) * directions.shape[0], n * m)
+    sources = np.empty(size, dtype=np.int64)
+    targets = np.empty(size, dtype=np.int64)
+    height_rolls = np.zeros(size)
+    count = 0
+    for index in range(directions.shape[0]):
+        di, dj = directions[index, 0], directions[index, 1]
+        for k, cell in enumerate(cells):
+            x, y = cell // m + di, cell % m + dj
+            if x < 0 or x >= n or y < 0 or y >= m:
+                continue
+            target = x * m + y
+            source, kind = types[cell], types[target]
+            if converted[target] or not allowed[source, kind]:
+                continue
+            key = np.uint64(0)
+            roll = 0.0
+            if rolls[source]:
+                key = _fold(step_keys[k], index)
+                roll = _unit(_fold(key, 0))
+            same = coeff[k]
+            if not (
+                roll
+                + age_coeff[k] / age_divisor[source, kind]
+                + same**2 / coeff_divisor[source, kind]
+                > above[source, kind]
+                or coeff_low[source, kind] <= same < coeff_high[source, kind]
+            ):
+                continue
+            converted[target] = True
+            sources[count] = k
+            targets[count] = target
+            if rolls[source]:
+                height_rolls[count] = _unit(_fold(key, 1))
+            count += 1
+    return sources[:count], targets[:count], height_rolls[:count]
+
+
+if AVAILABLE:
+    _fold = numba.njit(cache=True)(_fold)
+    _unit = numba.njit(cache=True)(_unit)
+    _grows = numba.njit(cache=True)(_grows)
+    _claims = numba.njit(cache=True)(_claims)
+
+
+def grows(types, cells, n, m):
+    """
+    array_grid.grows with the compiled loops
+    """
+    return _grows(types, cells, n, m, _DIRECTIONS, RULES.allowed)
+
+
+def claims(types, cells, ages, thresholds, step_keys, converted, n, m):
+    """
+    array_grid.claims with the compiled loops
+    """
+    return _claims(
+        types,
+        cells,
+        ages,
+        thresholds,
+        step_keys,
+        converted,
+        n,
+        m,
+        _DIRECTIONS,
+        RULES.rolls,
+        RULES.uses_coeff,
+        RULES.allowed,
+        RULES.above,
+        RULES.age_divisor,
+        RULES.coeff_divisor,
+        RULES.coeff_low,
+        RULES.coeff_high,
+    )
+
+
+class NumbaGrid(ArrayGrid):
+    """
+    ArrayGrid whose frontier's targets are found by compiled loops, the maps are the
+    same as ArrayGrid's
+    The first step of a process compiles the loops unless they are cached
+    """
+
+    ENGINE = "numba"
+    _grows = staticmethod(grows)
+    _claims = staticmethod(claims)
@@ -0,0 +1,72 @@
+"""
+Precomputed cell colors
+"""
+
+import numpy as np
+from matplotlib import colors
+
+from cells import CELL_TYPES
+
+# Heights out of this range have all of their channels clamped
+MIN_HEIGHT, MAX_HEIGHT = -90, 110
+
+# Colors of the types at the default height
+BASE_COLORS = np.array([colors.hex2color(cls.COLOR) for cls in CELL_TYPES])
+
+
+def shade(types: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    """
+    Calculate RGB colors of cells based on their types and heights, same as Cell.color
+    """
+    heights = np.asarray(heights, dtype=np.float64)[..., None]
+    rgb = np.clip(BASE_COLORS[types] + (heights - 10) / 100, 0, 1)
+    return np.round(rgb * 255).astype(np.uint8)
+
+
+def pack(rgb: np.ndarray) -> np.ndarray:
+    """
+    Pack RGB channels into 0xRRGGBB integers
+    """
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+_HEIGHTS = np.arange(MIN_HEIGHT, MAX_HEIGHT + 1)
+PALETTE = pack(
+    shade(np.arange(len(CELL_TYPES))[:, None], _HEIGHTS[None, :].astype(float))
+)
+
+
+def packed_color(code: int, height: float) -> int:
+    """
+    Get the color of a cell of the given type code and height as a 0xRRGGBB integer
+    """
+    if height == int(height):
+        index = min(max(int(height), MIN_HEIGHT), MAX_HEIGHT) - MIN_HEIGHT
+        return int(PALETTE[code, index])
+    return int(pack(shade(np.array(code), height)))
+
+
+def to_packed(types: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    """
+    Get the colors of a whole map as 0xRRGGBB integers
+    Integer heights are looked up in the palette, the others (water depths) are
+    calculated
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    index = np.clip(heights, MIN_HEIGHT, MAX_HEIGHT).astype(np.intp) - MIN_HEIGHT
+    packed = PALETTE[types, index]
+    fractional = heights != np.floor(heights)
+    if fractional.any():
+        packed[fractional] = pack(shade(types[fractional], heights[fractional]))
+    return packed
+
+
+def to_rgb(types: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    """
+    Get the colors of a whole map as an RGB array of shape (rows, cols, 3)
+    """
+    packed = to_packed(types, heights)
+    return np.stack(
+        [(packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF], axis=-1
+    ).astype(np.uint8)
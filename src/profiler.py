@@ -0,0 +1,114 @@
+"""
+Per-phase timing and counters of the generation
+"""
+
+import json
+import time
+from contextlib import nullcontext
+
+_NULL = nullcontext()
+
+
+class _Phase:
+    """
+    Times a single phase, see Profiler.phase
+    """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    Wall time of the phases of every step and counters such as cells visited or
+    changed
+    A disabled profiler does nothing, its phases are a shared empty context manager
+    If a trace path is given, every step is written to it as a line of JSON
+    """
+
+    def __init__(self, enabled: bool = False, trace: str | None = None) -> None:
+        self.enabled = enabled or trace is not None
+        self.times: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.totals: dict[str, float] = {}
+        self.steps = 0
+        self.last: dict | None = None
+        self._trace = (
+            open(trace, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+            if trace is not None
+            else None
+        )
+
+    def phase(self, name: str):
+        """
+        Context manager adding the time spent in it to the named phase of this step
+        """
+        return _Phase(self, name) if self.enabled else _NULL
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        Add time to the named phase of this step
+        """
+        if self.enabled:
+            self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int) -> None:
+        """
+        Add to the named counter of this step
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def end_step(self, step: int, phase: str) -> None:
+        """
+        Close the current step, its values are kept as the last step and added to the
+        totals
+        """
+        if not self.enabled:
+            return
+        times, counters = self.times, self.counters
+        self.times, self.counters = {}, {}
+        self.last = {"step": step, "phase": phase, "times": times, "counters": counters}
+        self.steps += 1
+        for name, value in (times | counters).items():
+            self.totals[name] = self.totals.get(name, 0) + value
+        if self._trace is not None:
+            self._trace.write(json.dumps(self.last) + "\n")
+
+    def summary(self, *others: "Profiler") -> str:
+        """
+        Short description of the last step, the last steps of other profilers, such as
+        one of another thread, are merged into it
+        """
+        lasts = [
+            profiler.last for profiler in (self, *others) if profiler.last is not None
+        ]
+        times = ", ".join(
+            f"{name} {seconds * 1000:.2f}ms"
+            for last in lasts
+            for name, seconds in last["times"].items()
+        )
+        counters = ", ".join(
+            f"{name} {value}"
+            for last in lasts
+            for name, value in last["counters"].items()
+        )
+        return "\n".join(line for line in (times, counters) if line)
+
+    def close(self) -> None:
+        """
+        Close the trace file
+        """
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
@@ -0,0 +1,166 @@
+"""
+Per-step delta log of a generation and its replay
+
+Layout of a log file:
+    magic (8 bytes) | format version, rows, cols, keyframe interval (uint32 each) |
+    records
+Every record is a kind byte, the step and the payload's length (uint32 each) and a
+zlib compressed payload. Keyframes ("K") hold the type codes and heights of all cells,
+deltas ("D") hold the flat indices, type codes and heights of the changed cells only
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from grid import Grid, Changes
+
+MAGIC = b"TGDELTA\x00"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIII")
+_RECORD = struct.Struct("<cII")
+KEYFRAME, DELTA = b"K", b"D"
+
+
+class DeltaRecorder:
+    """
+    Writes the changes of a grid to a log file step by step, as the generation runs
+    A keyframe of the whole map is written on creation and every keyframe_interval
+    steps, the steps between them are stored as deltas
+    """
+
+    def __init__(self, path: str, grid: Grid, keyframe_interval: int = 50) -> None:
+        self.path = path
+        self.grid = grid
+        self.keyframe_interval = keyframe_interval
+        self.step = 0
+        self._file = open(path, "wb")  # pylint: disable=consider-using-with
+        self._file.write(
+            _HEADER.pack(MAGIC, VERSION, grid.n_rows, grid.n_cols, keyframe_interval)
+        )
+        self._keyframe()
+
+    def _write(self, kind: bytes, arrays) -> None:
+        payload = zlib.compress(b"".join(array.tobytes() for array in arrays))
+        self._file.write(_RECORD.pack(kind, self.step, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+
+    def _keyframe(self) -> None:
+        self._write(
+            KEYFRAME,
+            (
+                self.grid.type_array().astype(np.uint8),
+                self.grid.height_array().astype(np.float64),
+            ),
+        )
+
+    def record(self, changes: Changes) -> None:
+        """
+        Record the changes of a single step, as returned by Grid.pop_changes
+        """
+        self.step += 1
+        if self.step % self.keyframe_interval == 0:
+            self._keyframe()
+            return
+        index = np.asarray(
+            np.ravel_multi_index(
+                (changes.x, changes.y), (self.grid.n_rows, self.grid.n_cols)
+            ),
+            dtype=np.uint32,
+        )
+        self._write(
+            DELTA,
+            (
+                np.uint32(len(index)),
+                index,
+                changes.types.astype(np.uint8),
+                changes.height.astype(np.float64),
+            ),
+        )
+
+    def close(self) -> None:
+        """
+        Close the log file
+        """
+        self._file.close()
+
+
+class Replay:
+    """
+    Rebuilds any step of a recorded generation from the nearest keyframe and deltas
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._records = {}
+        with open(path, "rb") as file:
+            size = file.seek(0, 2)
+            file.seek(0)
+            magic, version, rows, cols, interval = _HEADER.unpack(
+                file.read(_HEADER.size)
+            )
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a delta log")
+            if version > VERSION:
+                raise ValueError(f"unsupported delta log version {version}")
+            # A record cut short by an interrupted run is dropped
+            while len(header := file.read(_RECORD.size)) == _RECORD.size:
+                kind, step, length = _RECORD.unpack(header)
+                if file.tell() + length > size:
+                    break
+                self._records[step] = (kind, file.tell(), length)
+                file.seek(length, 1)
+        if 0 not in self._records:
+            raise ValueError(f"{path} has no initial keyframe")
+        self.n_rows, self.n_cols = rows, cols
+        self.keyframe_interval = interval
+        self.steps = len(self._records) - 1
+        self._cache = None
+
+    def _payload(self, step: int) -> bytes:
+        _, offset, length = self._records[step]
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return zlib.decompress(file.read(length))
+
+    def _keyframe(self, step: int) -> tuple[np.ndarray, np.ndarray]:
+        size = self.n_rows * self.n_cols
+        data = self._payload(step)
+        types = np.frombuffer(data, dtype=np.uint8, count=size).copy()
+        height = np.frombuffer(data, dtype=np.float64, offset=size).copy()
+        return types, height
+
+    def _apply(self, step: int, types: np.ndarray, height: np.ndarray) -> None:
+        if self._records[step][0] == KEYFRAME:
+            types[:], height[:] = self._keyframe(step)
+            return
+        data = self._payload(step)
+        count = int(np.frombuffer(data, dtype=np.uint32, count=1)[0])
+        offset = 4
+        index = np.frombuffer(data, dtype=np.uint32, count=count, offset=offset)
+        offset += 4 * count
+        types[index] = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+        offset += count
+        height[index] = np.frombuffer(
+            data, dtype=np.float64, count=count, offset=offset
+        )
+
+    def frame(self, step: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get type codes and heights of the map after the given step (0 is the initial map)
+        """
+        if not 0 <= step <= self.steps:
+            raise IndexError(f"step {step} is out of range 0..{self.steps}")
+        start = step - step % self.keyframe_interval
+        if self._cache is not None and start <= self._cache[0] <= step:
+            current, types, height = self._cache
+        else:
+            current = start
+            types, height = self._keyframe(start)
+        for i in range(current + 1, step + 1):
+            self._apply(i, types, height)
+        self._cache = (step, types, height)
+        shape = (self.n_rows, self.n_cols)
+        return types.reshape(shape).copy(), height.reshape(shape).copy()
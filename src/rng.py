@@ -0,0 +1,130 @@
+"""
+Counter-based random numbers
+
+Every roll is a hash of a key, derived from the seed and the name of a stream, and of
+a few integers that say what it is for (phase, step, cell's coordinates, direction,
+slot). Any roll can be computed on its own and in bulk, so the map of a seed does not
+depend on the order in which an engine visits cells. It still depends on the engine:
+the reference one updates cells one after another and the array ones all at once, so
+a seed is only reproducible within an engine (numpy and numba give the same maps)
+The hash is the splitmix64 finalizer applied once per integer, the same values are
+given by the scalar and the NumPy versions
+"""
+
+import hashlib
+from bisect import bisect
+from itertools import accumulate
+
+import numpy as np
+
+_MASK = (1 << 64) - 1
+_GAMMA = 0x9E3779B97F4A7C15
+_M1, _M2 = 0xBF58476D1CE4E5B9, 0x94D049BB133111EB
+
+# Streams of a map, each one is independent from the others
+GENERATION = "generation"
+TEXTURES = "textures"
+
+# First word of the generation's rolls
+PLACEMENT, INFECTION = 0, 1
+
+
+def stream_key(seed: str, stream: str) -> int:
+    """
+    Get the 64 bit key of a named stream of a seed
+    """
+    digest = hashlib.sha256(f"{seed}/{stream}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def _mix(z: int) -> int:
+    z = ((z ^ (z >> 30)) * _M1) & _MASK
+    z = ((z ^ (z >> 27)) * _M2) & _MASK
+    return z ^ (z >> 31)
+
+
+def fold(key: int, *words: int) -> int:
+    """
+    Hash the integers one at a time into the key
+    The hash of some leading words can be kept and used as the key of the rest
+    """
+    for word in words:
+        key = _mix((key + _GAMMA + word) & _MASK)
+    return key
+
+
+def roll(key: int, *words: int) -> float:
+    """
+    Get a uniform float in [0, 1) for the given key and integers
+    """
+    return (fold(key, *words) >> 11) * 2.0**-53
+
+
+def hashes(key, *words) -> np.ndarray:
+    """
+    Vectorized fold, the key and the words can be integers or arrays broadcast
+    together
+    """
+    h = np.asarray(key, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for word in words:
+            h = h + np.asarray(word).astype(np.uint64)
+            h += np.uint64(_GAMMA)
+            h ^= h >> np.uint64(30)
+            h *= np.uint64(_M1)
+            h ^= h >> np.uint64(27)
+            h *= np.uint64(_M2)
+            h ^= h >> np.uint64(31)
+    return h
+
+
+def to_unit(h: np.ndarray) -> np.ndarray:
+    """
+    Turn hashes into uniform floats in [0, 1), same as roll
+    """
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+class Stream:
+    """
+    Sequence of rolls for the given key and integers, the n-th call gets slot n
+    Offers the part of the random module's interface used by the cells and the grid,
+    so it can be passed wherever rng=random is accepted
+    """
+
+    __slots__ = ("key", "words", "slot")
+
+    def __init__(self, key: int, *words: int) -> None:
+        self.key = key
+        self.words = words
+        self.slot = 0
+
+    def random(self) -> float:
+        """
+        Get the next uniform float in [0, 1)
+        """
+        value = roll(self.key, *self.words, self.slot)
+        self.slot += 1
+        return value
+
+    def randoms(self, count: int) -> np.ndarray:
+        """
+        Get the next count uniform floats in [0, 1) at once, same as count calls of
+        random
+        """
+        slots = np.arange(self.slot, self.slot + count)
+        self.slot += count
+        return to_unit(hashes(fold(self.key, *self.words), slots))
+
+    def randint(self, a: int, b: int) -> int:
+        """
+        Get the next integer in [a, b]
+        """
+        return a + int(self.random() * (b - a + 1))
+
+    def choices(self, population, weights) -> list:
+        """
+        Choose a single element of the population with the given weights
+        """
+        cumulative = list(accumulate(weights))
+        return [population[bisect(cumulative, self.random() * cumulative[-1])]]
@@ -0,0 +1,257 @@
+"""
+Biome rules
+
+Biomes, their transitions and the biomes seeded by the generation are defined in a
+data file (biomes.toml next to this module unless the TERRAIN_RULES environment
+variable names another one, JSON files are read too) and compiled once into per-biome
+transition tables for the cells and into lookup arrays indexed by source and target
+type IDs, which evaluate the rules of all cells at once
+"""
+
+import json
+import math
+import os
+import tomllib
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "biomes.toml")
+# Environment variable with the path of the rules file to use instead of DEFAULT_PATH
+PATH_VARIABLE = "TERRAIN_RULES"
+
+_BIOME_KEYS = {
+    "color",
+    "threshold_age",
+    "texture_probability",
+    "subtypes",
+    "submissive",
+    "rolls_height",
+    "infect",
+}
+_INFECT_KEYS = {"targets", "above", "age_divisor", "coeff_divisor", "coeff_range"}
+# Table of the seeded biomes, its name can't be a biome's
+_SEEDS = "seeds"
+_SEED_KEYS = {"starting", "secondary"}
+
+
+class Transition(NamedTuple):
+    """
+    When a biome infects a neighbour of a given type, see biomes.toml
+    Divisors are None for the terms that are not added
+    """
+
+    roll: bool
+    above: float
+    age_divisor: float | None
+    coeff_divisor: float | None
+    coeff_range: tuple[int, int]
+
+
+class Biome(NamedTuple):
+    """
+    A biome of a rule set, submissive types are a bitmask of type IDs and transitions
+    are keyed by the target's type ID
+    """
+
+    name: str
+    type_id: int
+    color: str
+    threshold_age: float
+    texture_probability: float
+    subtypes: dict
+    submissive: int
+    rolls_height: bool
+    transitions: dict[int, Transition]
+
+    @property
+    def rolls(self) -> bool:
+        """
+        Whether the cells of the biome ever roll
+        """
+        return self.rolls_height or any(t.roll for t in self.transitions.values())
+
+    @property
+    def uses_coeff(self) -> bool:
+        """
+        Whether any transition depends on the number of same type neighbours
+        """
+        return any(
+            t.coeff_divisor is not None or t.coeff_range[0] < t.coeff_range[1]
+            for t in self.transitions.values()
+        )
+
+
+class RuleSet:
+    """
+    Compiled biome rules
+    The arrays are indexed by type IDs, [source, target] for the transitions
+    Starting and secondary are the type IDs of the biomes seeded on an empty map and
+    once the first phase is over, in the order their seed cells are drawn
+    """
+
+    def __init__(
+        self,
+        biomes: list[Biome],
+        starting: tuple[int, ...] = (),
+        secondary: tuple[int, ...] = (),
+    ) -> None:
+        self.biomes = biomes
+        self.ids = {biome.name: biome.type_id for biome in biomes}
+        self.starting = starting
+        self.secondary = secondary
+        n = len(biomes)
+        self.allowed = np.zeros((n, n), dtype=bool)
+        self.above = np.full((n, n), np.inf)
+        self.age_divisor = np.full((n, n), np.inf)
+        self.coeff_divisor = np.full((n, n), np.inf)
+        self.coeff_low = np.zeros((n, n), dtype=np.int32)
+        self.coeff_high = np.zeros((n, n), dtype=np.int32)
+        for biome in biomes:
+            for target, rule in biome.transitions.items():
+                index = biome.type_id, target
+                self.allowed[index] = True
+                self.above[index] = rule.above
+                if rule.age_divisor is not None:
+                    self.age_divisor[index] = rule.age_divisor
+                if rule.coeff_divisor is not None:
+                    self.coeff_divisor[index] = rule.coeff_divisor
+                self.coeff_low[index], self.coeff_high[index] = rule.coeff_range
+        self.rolls = np.array([biome.rolls for biome in biomes], dtype=bool)
+        self.rolls_height = np.array([biome.rolls_height for biome in biomes])
+        self.uses_coeff = np.array([biome.uses_coeff for biome in biomes], dtype=bool)
+
+    def require(self, *names: str) -> tuple[int, ...]:
+        """
+        Get the type IDs of biomes the generation can't do without
+        """
+        missing = [name for name in names if name not in self.ids]
+        if missing:
+            raise ValueError(f"the rule set has no {', '.join(missing)} biome")
+        return tuple(self.ids[name] for name in names)
+
+    def infection_mask(self, source, target, coeff, age_coeff, rolls):
+        """
+        Evaluate the transitions of every source at once, same as Cell.infect
+        All arguments are arrays of the same shape: source and target type IDs, same
+        type neighbour counts and age coefficients of the sources and uniform rolls,
+        the sources' ages are not checked
+        """
+        mask = self.allowed[source, target]
+        # Most neighbours can't be infected at all, only the others are evaluated
+        cells = np.nonzero(mask)
+        index = source[cells], target[cells]
+        coeff = coeff[cells]
+        mask[cells] = (
+            rolls[cells]
+            + age_coeff[cells] / self.age_divisor[index]
+            + coeff**2 / self.coeff_divisor[index]
+            > self.above[index]
+        ) | ((coeff >= self.coeff_low[index]) & (coeff < self.coeff_high[index]))
+        return mask
+
+
+def _fail(path, message):
+    raise ValueError(f"{path}: {message}")
+
+
+def _ids(path, names, ids, where):
+    for name in names:
+        if name not in ids:
+            _fail(path, f"unknown biome {name!r} in {where}")
+    return tuple(ids[name] for name in names)
+
+
+def _mask(path, names, ids, where):
+    mask = 0
+    for type_id in _ids(path, names, ids, where):
+        mask |= 1 << type_id
+    return mask
+
+
+def _seeds(path, table, ids):
+    unknown = set(table) - _SEED_KEYS
+    if unknown:
+        _fail(path, f"unknown keys {sorted(unknown)} in {_SEEDS}")
+    starting = _ids(path, table.get("starting", []), ids, f"{_SEEDS}.starting")
+    if not starting:
+        _fail(path, f"{_SEEDS}.starting has no biome")
+    return starting, _ids(path, table.get("secondary", []), ids, f"{_SEEDS}.secondary")
+
+
+def _transition(path, name, table, submissive, ids):
+    unknown = set(table) - _INFECT_KEYS
+    if unknown:
+        _fail(path, f"unknown keys {sorted(unknown)} in {name}.infect")
+    roll = "above" in table
+    if not roll and {"age_divisor", "coeff_divisor"} & set(table):
+        _fail(path, f"{name}.infect adds to a roll but has no above")
+    targets = table.get("targets")
+    mask = submissive if targets is None else _mask(path, targets, ids, name)
+    rule = Transition(
+        roll,
+        float(table["above"]) if roll else -math.inf,
+        table.get("age_divisor"),
+        table.get("coeff_divisor"),
+        tuple(table.get("coeff_range", (0, 0))),
+    )
+    return {type_id: rule for type_id in range(len(ids)) if mask >> type_id & 1}
+
+
+def compile_rules(data: dict, path: str = "<rules>") -> RuleSet:
+    """
+    Compile biomes given as a mapping of their names to their tables, and the seeded
+    biomes given as the seeds table
+    """
+    data = dict(data)
+    seeds = data.pop(_SEEDS, {})
+    ids = {name: type_id for type_id, name in enumerate(data)}
+    biomes = []
+    for name, table in data.items():
+        unknown = set(table) - _BIOME_KEYS
+        if unknown:
+            _fail(path, f"unknown keys {sorted(unknown)} in {name}")
+        missing = {"color", "threshold_age"} - set(table)
+        if missing:
+            _fail(path, f"{name} has no {', '.join(sorted(missing))}")
+        submissive = _mask(path, table.get("submissive", []), ids, name)
+        transitions = {}
+        for rule in table.get("infect", []):
+            for target, transition in _transition(
+                path, name, rule, submissive, ids
+            ).items():
+                if target in transitions:
+                    _fail(
+                        path, f"{name} has several transitions to {list(ids)[target]}"
+                    )
+                transitions[target] = transition
+        biomes.append(
+            Biome(
+                name,
+                ids[name],
+                table["color"],
+                table["threshold_age"],
+                table.get("texture_probability", 0.3),
+                dict(table.get("subtypes", {})),
+                submissive,
+                table.get("rolls_height", True),
+                transitions,
+            )
+        )
+    return RuleSet(biomes, *_seeds(path, seeds, ids))
+
+
+def load(path: str = DEFAULT_PATH) -> RuleSet:
+    """
+    Load and compile a TOML or JSON rules file
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+    else:
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    return compile_rules(data, path)
+
+
+RULES = load(os.environ.get(PATH_VARIABLE, DEFAULT_PATH))
@@ -0,0 +1,80 @@
+"""
+Binary snapshots of the grid's state
+
+Layout of a snapshot file:
+    magic (8 bytes) | format version (uint32) | header length (uint32) |
+    JSON header, padded | arrays, each one starting at a multiple of ALIGNMENT
+The header holds the metadata given by the grid (size, seed, phase, step...)
+and the dtype, shape and offset of every array, so arrays can be opened in place
+with np.memmap without reading the whole file
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"TGSNAP\x00\x00"
+VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write(path: str, meta: dict, arrays: dict[str, np.ndarray]) -> None:
+    """
+    Write a snapshot made of JSON serializable metadata and named arrays
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    # Offsets depend on the header's length, which depends on the offsets
+    header_size = ALIGNMENT
+    while True:
+        offset = header_size
+        for name, array in arrays.items():
+            layout[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({"meta": meta, "arrays": layout}).encode()
+        needed = _aligned(_PREFIX.size + len(header))
+        if needed <= header_size:
+            break
+        header_size = needed
+    with open(path, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(layout[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(max(offset, header_size))
+
+
+def read(path: str, mode: str = "c") -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Open a snapshot, returns its metadata and memory-mapped arrays
+    The default copy-on-write mode lets the arrays be changed without touching the
+    file, "r" opens them read-only
+    """
+    with open(path, "rb") as file:
+        magic, version, length = _PREFIX.unpack(file.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a grid snapshot")
+        if version > VERSION:
+            raise ValueError(f"unsupported snapshot version {version}")
+        header = json.loads(file.read(length))
+    arrays = {}
+    for name, info in header["arrays"].items():
+        shape = tuple(info["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=info["dtype"])
+            continue
+        arrays[name] = np.memmap(
+            path, dtype=info["dtype"], mode=mode, offset=info["offset"], shape=shape
+        )
+    return header["meta"], arrays
@@ -0,0 +1,336 @@
+"""
+Stripe-parallel stepping of a single map
+
+The map is split into horizontal stripes, the main process steps the first one and a
+worker process every other one. Every process keeps a grid of its stripe's window, the
+stripe with HALO rows of the neighbouring stripes on both sides, and steps only its
+frontier, as ArrayGrid does. The state of the map is kept twice in shared memory: a
+step reads the halos from one copy and writes the cells of its own rows it has
+changed into the other one, so the halos are exchanged in the same phase as the step
+and a step ends with a single barrier. After it every process reads the results of
+all stripes and, while the phase goes on, starts the next step right away; the main
+process only has to send the step once a phase has ended, then the windows are read
+again in full, or to stop the workers. A stripe gets the same cells as the whole map,
+so the maps are the same for any number of workers
+"""
+
+import itertools
+import multiprocessing
+import threading
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from cells import WATER
+
+# Rows of the neighbouring stripes a stripe needs: a cell infects its neighbours (1 row)
+# unless other cells next to them took them first (2 rows), which depends on the same
+# type neighbour counts of those cells (3 rows)
+HALO = 3
+# Cells a stripe needs at least for its step to outweigh the barrier, a map is split
+# into fewer stripes rather than into smaller ones
+MIN_CELLS = 1 << 16
+# Arrays of the state of the map, the ages of idle active cells are brought up to date
+# lazily from the clock, see ArrayGrid
+STATE = ("types", "age", "threshold", "height", "active", "_clock")
+# Arrays of the grid held in shared memory, all of the same shape, the state twice
+FIELDS = STATE + ("_cell_keys",)
+# Settings of a command: barrier round it's for, phase, step, copy of the state the
+# step reads, stop. They are written into one of two slots by round, a process still
+# reading the last command can't see the next one
+ROUND, PHASE, STEP, SOURCE, STOP = range(5)
+# Results of a stripe: converted cells, whether land can still grow, first and last + 1
+# rows with converted cells, cells of the frontier visited
+CONVERTED, GROWING, LOW, HIGH, VISITED = range(5)
+
+
+def stripes(shape: tuple[int, int], workers: int) -> int:
+    """
+    Get the number of stripes a map is split into for a number of workers
+    """
+    return max(1, min(workers, shape[0], shape[0] * shape[1] // MIN_CELLS))
+
+
+class _Shared:
+    """
+    Views of the shared memory blocks of a pool
+    """
+
+    def __init__(self, blocks, shape, dtypes, workers) -> None:
+        views = iter(blocks)
+        self.state = [
+            {name: np.ndarray(shape, dtypes[name], next(views).buf) for name in STATE}
+            for _ in range(2)
+        ]
+        self.converted = [np.ndarray(shape, bool, next(views).buf) for _ in range(2)]
+        self.cell_keys = np.ndarray(shape, dtypes["_cell_keys"], next(views).buf)
+        self.settings = np.ndarray((2, 5), np.int64, next(views).buf)
+        self.results = np.ndarray((2, workers, 5), np.int64, next(views).buf)
+
+
+def _continues(results) -> bool:
+    # Same as ArrayGrid.revert_changed: the phase goes on while cells convert or land
+    # can grow
+    return bool(results[:, CONVERTED].any() or results[:, GROWING].any())
+
+
+class _Stripe:
+    """
+    Stripe of the map stepped by a process, on a grid of its window of the class of
+    the split grid
+    The grid's frontier is kept from step to step, only the halos are read again before
+    a step and only the cells a step has changed are written to the shared state
+    """
+
+    # pylint: disable=protected-access
+
+    def __init__(self, cls, shared: _Shared, index: int, rows: tuple[int, int]):
+        self._cls = cls
+        self._shared = shared
+        self._index = index
+        self._rows = rows
+        n = shared.cell_keys.shape[0]
+        self._window = slice(max(rows[0] - HALO, 0), min(rows[1] + HALO, n))
+        # Rows of the stripe within the window
+        self._kept = slice(rows[0] - self._window.start, rows[1] - self._window.start)
+        self._grid = None
+        # Own cells changed by the last step, the other copy is behind by them, None
+        # if the stripe has to be written in full
+        self._written = None
+        # Converted cells marked in both copies of the converted mask, flat indices
+        self._marked = [np.zeros(0, dtype=np.int64)] * 2
+
+    def _load(self, source: int, step: int) -> None:
+        old = self._shared.state[source]
+        self._grid = self._cls.window(
+            {name: old[name][self._window].copy() for name in STATE},
+            self._shared.cell_keys[self._window],
+            step,
+        )
+        self._written = None
+
+    def _read_halos(self, source: int, step: int) -> None:
+        grid, old = self._grid, self._shared.state[source]
+        window, kept = self._window, self._kept
+        for rows, halo in (
+            (slice(window.start, self._rows[0]), slice(0, kept.start)),
+            (slice(self._rows[1], window.stop), slice(kept.stop, grid.n_rows)),
+        ):
+            for name in STATE:
+                getattr(grid, name)[halo] = old[name][rows]
+        # Cells within a row of the halos may have left or joined the frontier
+        near = np.zeros(grid.n_rows, dtype=bool)
+        if kept.start:
+            near[: kept.start + 1] = True
+        if kept.stop < grid.n_rows:
+            near[kept.stop - 1 :] = True
+        m = grid.n_cols
+        cells = (np.flatnonzero(near)[:, None] * m + np.arange(m)).reshape(-1)
+        frontier = grid._frontier
+        grid._frontier = np.union1d(
+            frontier[~near[frontier // m]], grid._grown(cells, step)
+        )
+
+    def step(self, ind: int, step: int, source: int, fresh: bool) -> None:
+        """
+        Make a step of the stripe, reading the halos from a copy of the state and
+        writing the cells it has changed to the other one, the window is read in full
+        if fresh
+        """
+        if fresh:
+            self._load(source, step)
+        else:
+            self._read_halos(source, step)
+        grid, kept = self._grid, self._kept
+        m = grid.n_cols
+        grid._step = step
+        cells, targets = grid._infect_frontier(ind)
+        low, high = kept.start * m, kept.stop * m
+        cells = cells[(cells >= low) & (cells < high)]
+        targets = targets[(targets >= low) & (targets < high)]
+        changed = np.concatenate([cells, targets])
+        new = self._shared.state[1 - source]
+        if self._written is None:
+            for name in STATE:
+                new[name][self._rows[0] : self._rows[1]] = getattr(grid, name)[kept]
+        else:
+            written = np.concatenate([self._written, changed])
+            offset = self._window.start * m
+            for name in STATE:
+                array = getattr(grid, name).reshape(-1)
+                new[name].reshape(-1)[written + offset] = array[written]
+        self._written = changed
+        # Targets as flat indices of the map
+        targets = targets + self._window.start * m
+        converted = self._shared.converted[1 - source].reshape(-1)
+        converted[self._marked[1 - source]] = False
+        converted[targets] = True
+        self._marked[1 - source] = targets
+        frontier = grid._frontier
+        frontier = frontier[(frontier >= low) & (frontier < high)]
+        res = self._shared.results[step % 2, self._index]
+        res[CONVERTED] = len(targets)
+        res[LOW] = targets.min() // m if len(targets) else 0
+        res[HIGH] = targets.max() // m + 1 if len(targets) else 0
+        res[GROWING] = (grid.types.reshape(-1)[frontier] != WATER).any()
+        res[VISITED] = len(cells)
+
+
+def _work(cls, blocks, shape, dtypes, barrier, index, rows):
+    shared = _Shared(blocks, shape, dtypes, barrier.parties)
+    stripe = _Stripe(cls, shared, index, rows)
+    ind, step, source = 0, 0, 0
+    running = False
+    try:
+        for rounds in itertools.count():
+            barrier.wait()
+            settings = shared.settings[rounds % 2]
+            fresh = settings[ROUND] == rounds
+            if fresh:
+                if settings[STOP]:
+                    return
+                ind, step, source = (int(i) for i in settings[PHASE:STOP])
+                running = True
+            elif running and _continues(shared.results[step % 2]):
+                step, source = step + 1, 1 - source
+            else:
+                running = False
+                continue
+            stripe.step(ind, step, source, fresh)
+    except threading.BrokenBarrierError:
+        return
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+class StripePool:
+    """
+    Processes stepping the stripes of a map, the main one included
+    arrays are the FIELDS of the grid, they are copied to shared memory, the grid
+    steps with the shared ones in self.arrays, which change with every step, until
+    close; cls is the grid's class, the stripes are stepped on its window grids
+    """
+
+    def __init__(self, arrays: dict, cls, workers: int) -> None:
+        shape = arrays["types"].shape
+        workers = stripes(shape, workers)
+        dtypes = {name: arrays[name].dtype for name in FIELDS}
+        sizes = [arrays[name].nbytes for name in STATE] * 2
+        sizes += [arrays["types"].size] * 2 + [arrays["_cell_keys"].nbytes]
+        sizes += [8 * 2 * 5, 8 * 2 * workers * 5]
+        blocks = [SharedMemory(create=True, size=max(size, 1)) for size in sizes]
+        self._shared = _Shared(blocks, shape, dtypes, workers)
+        for name in STATE:
+            self._shared.state[0][name][...] = arrays[name]
+        self._shared.cell_keys[...] = arrays["_cell_keys"]
+        for converted in self._shared.converted:
+            converted[...] = False
+        self._shared.settings[:] = -1
+        self._blocks = blocks
+        self._source = 0
+        # Barrier rounds passed, the same in every process
+        self._rounds = 0
+        # Phase and step the workers have started on their own, None if they wait
+        self._running = None
+        self._barrier = multiprocessing.Barrier(workers)
+        bounds = np.linspace(0, shape[0], workers + 1).astype(int)
+        self._rows = [(int(bounds[i]), int(bounds[i + 1])) for i in range(workers)]
+        self._stripe = _Stripe(cls, self._shared, 0, self._rows[0])
+        self._processes = [
+            multiprocessing.Process(
+                target=_work,
+                args=(cls, blocks, shape, dtypes, self._barrier, i, self._rows[i]),
+                daemon=True,
+            )
+            for i in range(1, workers)
+        ]
+        self._finalizer = weakref.finalize(
+            self, _release, self._processes, self._blocks
+        )
+        for process in self._processes:
+            process.start()
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of processes stepping the map, the main one included
+        """
+        return len(self._rows)
+
+    @property
+    def arrays(self) -> dict:
+        """
+        Shared arrays of the grid, with the state after the last step
+        """
+        return {
+            **self._shared.state[self._source],
+            "_cell_keys": self._shared.cell_keys,
+        }
+
+    def step(self, ind: int, step: int, dirty: np.ndarray) -> tuple[int, bool, int]:
+        """
+        Make a step of the given phase on all stripes and mark the converted cells in
+        dirty, returns the number of cells converted, whether land can still grow and
+        the number of cells of the frontier visited
+        """
+        try:
+            fresh = self._running != (ind, step)
+            if fresh:
+                self._send(ind, step, self._source)
+                self._wait()
+            self._stripe.step(ind, step, self._source, fresh)
+            self._wait()
+        except threading.BrokenBarrierError as error:
+            raise RuntimeError("a stripe worker has failed") from error
+        except BaseException:
+            self._barrier.abort()
+            raise
+        self._source = 1 - self._source
+        results = self._shared.results[step % 2]
+        converted = self._shared.converted[self._source]
+        for low, high in results[:, [LOW, HIGH]]:
+            dirty[low:high] |= converted[low:high]
+        self._running = (ind, step + 1) if _continues(results) else None
+        return (
+            int(results[:, CONVERTED].sum()),
+            bool(results[:, GROWING].any()),
+            int(results[:, VISITED].sum()),
+        )
+
+    def _send(self, ind: int, step: int, source: int, stop: int = 0) -> None:
+        self._shared.settings[self._rounds % 2] = self._rounds, ind, step, source, stop
+
+    def _wait(self) -> None:
+        if self._processes:
+            self._barrier.wait()
+        self._rounds += 1
+
+    def close(self) -> None:
+        """
+        Stop the workers and free the shared memory, the shared arrays can't be used
+        afterwards
+        """
+        if not self._finalizer.alive:
+            return
+        self._send(0, 0, 0, 1)
+        try:
+            self._wait()
+        except threading.BrokenBarrierError:
+            pass
+        for process in self._processes:
+            process.join()
+        del self._shared, self._stripe
+        self._finalizer()
+        for block in self._blocks:
+            block.close()
+
+
+def _release(processes, blocks):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+    for block in blocks:
+        block.unlink()
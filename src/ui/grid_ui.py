@@ -1,134 +1,409 @@
 """
-Grid widget and grid cell widget
+Grid widget
 """
 
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFileDialog
+import os
+import tempfile
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QColor, QPixmap
+from PySide6.QtWidgets import QWidget, QFileDialog, QInputDialog
 
-from grid import Grid
+from PySide6.QtCore import QRectF, QThread, Qt, Signal
+from PySide6.QtGui import QImage, QPainter
+
+from engines import make_grid
+from profiler import Profiler
+from replay import DeltaRecorder, Replay
+from ui.textures import ATLAS
+from ui.viewport import MipPyramid, Viewport
+from ui.worker import StepWorker, is_full_redraw, render
 
 
 class GridWidget(QWidget):
     """
     Map grid widget
+    The map is kept as a single image with one pixel per cell, only its visible part is
+    painted, from a downsampled copy once cells are smaller than pixels
+    The map is zoomed with the mouse wheel, dragged to pan and fitted back to the widget
+    with a double click
+    Steps are made on a worker thread, the widget only swaps in their frames
     """
 
     DELAY = 300
+    ZOOM_STEP = 1.25
+    # Textures of cells smaller than this many pixels are not drawn
+    MIN_TEXTURE_SIDE = 2
+    COLORS_FILTER = "Map colors (*.png)"
+    HEIGHTMAP_FILTER = "Heightmap, 16-bit grayscale (*.png)"
+    MAX_EXPORT_SCALE = 64
+    step_requested = Signal()
+    finish_requested = Signal()
+    export_requested = Signal(str, bool, int, object, object)
 
     def __init__(
-        self, n_rows: int, n_cols: int, seed: str | None = None, parent=None
+        self,
+        n_rows: int,
+        n_cols: int,
+        seed: str | None = None,
+        engine: str = "reference",
+        parent=None,
     ) -> None:
         super().__init__(parent)
-        self.grid = Grid(n_rows, n_cols, seed)
+        self.grid = make_grid(engine, n_rows, n_cols, seed)
+        # Timing of the painting, the grid's profiler is written by the worker's thread
+        self.profiler = Profiler()
         self.setFixedSize(
             (int(1400 * parent.width() / 1920)), (int(900 * parent.height() / 1080))
         )
         self.n_rows = n_rows
         self.n_cols = n_cols
-        self.cells = []
-        self.grid_layout = QVBoxLayout()
-        self.grid_layout.setSpacing(0)
+        self.viewport = Viewport(n_rows, n_cols)
+        self.viewport.resize(self.width(), self.height())
+        self.pyramid = MipPyramid()
+        self.image = QImage()
+        self.textures = {}
+        self.texture_layer = None
+        self.texture_view = None
+        self.drag_start = None
+        handle, self.log_path = tempfile.mkstemp(suffix=".tglog")
+        os.close(handle)
+        self.recorder = DeltaRecorder(self.log_path, self.grid)
+        self.replay = None
+        self.in_flight = False
+        self.finishing = False
+        self.worker = StepWorker(self.grid, self.recorder)
+        self.thread = QThread()
+        self.worker.moveToThread(self.thread)
+        self.step_requested.connect(self.worker.step)
+        self.finish_requested.connect(self.worker.finish)
+        self.export_requested.connect(self.worker.export)
+        self.worker.export_progress.connect(self.show_export_progress)
+        self.worker.exported.connect(self.show_exported)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.frame_ready.connect(self.swap_frame)
+        self.thread.start()
         self.setContentsMargins(0, 0, 0, 0)
         self.parent_ = parent
-        self.setLayout(self.grid_layout)
-        self.parent_.side_panel.export_button.clicked.connect(self.export_as_png)
+
+    def enable_profiling(self, enabled: bool) -> None:
+        """
+        Enable or disable the profilers of the grid's steps and of the painting
+        """
+        self.grid.profiler.enabled = enabled
+        self.profiler.enabled = enabled
 
     def clear_grid(self):
         """
-        Clear current grid's layout
+        Clear current grid's image and textures
         """
-        self.grid_layout = QVBoxLayout()
-        self.grid_layout.setSpacing(0)
-        self.cells = []
+        self.image = QImage()
+        self.pyramid.set_image(self.image)
+        self.clear_textures()
 
     def display_grid(self):
         """
         Displays grid
         """
-        self.grid_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        for _ in range(self.n_rows):
-            row = QHBoxLayout()
-            row.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            row.setSpacing(0)
-            row.setContentsMargins(0, 0, 0, 0)
-            for _ in range(self.n_cols):
-                cell = GridCellWidget(self, self.n_cols, self.n_rows)
-                cell.raise_()
-                row.addWidget(cell, alignment=Qt.AlignmentFlag.AlignCenter)
-                self.cells.append(cell)
-            self.grid_layout.addLayout(row)
-        self.update_grid()
+        self.grid.pop_changes()
+        self.redraw_grid()
 
-    def update_grid(self):
+    def cell_size(self):
         """
-        Updates current grid
+        Side of a single cell in pixels
         """
-        for i, cell in enumerate(self.cells):
-            color = QColor(self.grid[i // self.n_cols][i % self.n_cols].color)
-            cell.set_color(color)
+        return self.viewport.scale
 
-    def generate_map(self):
+    def cell_rect(self, x, y):
         """
-        Start map's generation
+        Rectangle of a cell in widget's coordinates
         """
-        is_stopped = self.grid.update_grid()
-        self.update_grid()
-        if is_stopped:
-            self.parent_.toggle_update()
-            self.parent_.side_panel.textures_button.setEnabled(True)
+        return self.viewport.cell_rect(x, y)
 
-    def export_as_png(self):
+    def update_grid(self, image, changes=None):
         """
-        Export the map as png
+        Updates current grid with a new frame, only the visible cells changed since the
+        last frame are repainted
         """
-        pixmap = QPixmap(self.size())
-        self.render(pixmap)
-        file_name, _ = QFileDialog.getSaveFileName(
-            self, "Save Image", "", "PNG (*.png)"
+        self.image = image
+        if changes is None or is_full_redraw(changes, self.n_rows, self.n_cols):
+            self.pyramid.set_image(image)
+            self.update()
+            return
+        self.pyramid.set_image(image, changes)
+        top, bottom, left, right = self.viewport.visible()
+        shown = (
+            (changes.x >= top)
+            & (changes.x < bottom)
+            & (changes.y >= left)
+            & (changes.y < right)
         )
-        if file_name:
-            pixmap.save(file_name + ".png", "PNG")
+        if shown.any():
+            x, y = changes.x[shown], changes.y[shown]
+            rect = self.viewport.cell_rect(
+                x.min(), y.min(), x.max() - x.min() + 1, y.max() - y.min() + 1
+            )
+            self.update(rect.toAlignedRect().adjusted(-1, -1, 1, 1))
 
+    def redraw_grid(self, types=None, height=None):
+        """
+        Redraws the whole grid, or the map given as type codes and heights
+        """
+        if types is None:
+            types, height = self.grid.type_array(), self.grid.height_array()
+        self.image = render(types, height)
+        self.pyramid.set_image(self.image)
+        self.update()
 
-class GridCellWidget(QLabel):
-    """
-    Cell widget
-    """
+    def set_textures(self, textures):
+        """
+        Replace all textures, names of textures in the atlas by cell
+        """
+        self.textures = textures
+        self.texture_layer = None
+        self.update()
 
-    def __init__(self, parent=None, grid_width=None, grid_height=None):
-        super().__init__()
-        self.size = grid_width, grid_height
-        self.parent_ = parent
-        min_side = min(
-            self.parent_.width() / grid_width, self.parent_.height() / grid_height
+    def clear_textures(self):
+        """
+        Remove all textures
+        """
+        self.set_textures({})
+
+    def paintEvent(self, event):  # pylint: disable=invalid-name,unused-argument
+        """
+        Paint the visible part of the map and its textures
+        """
+        if self.image.isNull():
+            return
+        with self.profiler.phase("paint"):
+            painter = QPainter(self)
+            view = self.viewport
+            top, bottom, left, right = view.visible()
+            level = min(view.level(), self.pyramid.depth())
+            # Pixels of the level per cell, its last ones may cover fewer cells
+            per_cell = 0.5**level
+            painter.drawImage(
+                view.cell_rect(top, left, bottom - top, right - left),
+                self.pyramid.level(level),
+                QRectF(
+                    left * per_cell,
+                    top * per_cell,
+                    (right - left) * per_cell,
+                    (bottom - top) * per_cell,
+                ),
+            )
+            if self.textures and view.scale >= self.MIN_TEXTURE_SIDE:
+                painter.drawImage(0, 0, self.visible_textures())
+            painter.end()
+
+    def visible_textures(self):
+        """
+        Textures of the visible cells drawn over a transparent image of the widget's
+        size, made again only once the view or the textures change
+        """
+        view = self.viewport
+        key = (view.scale, view.left, view.top, view.width, view.height)
+        if self.texture_layer is not None and self.texture_view == key:
+            return self.texture_layer
+        top, bottom, left, right = view.visible()
+        if (bottom - top) * (right - left) < len(self.textures):
+            cells = [
+                ((x, y), self.textures[x, y])
+                for x in range(top, bottom)
+                for y in range(left, right)
+                if (x, y) in self.textures
+            ]
+        else:
+            cells = [
+                ((x, y), name)
+                for (x, y), name in self.textures.items()
+                if top <= x < bottom and left <= y < right
+            ]
+        self.texture_layer = ATLAS.composite(
+            cells, view.cell_rect, max(1, round(view.scale)), self.size()
+        )
+        self.texture_view = key
+        return self.texture_layer
+
+    def resizeEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Resize the view with the widget
+        """
+        self.viewport.resize(self.width(), self.height())
+        QWidget.resizeEvent(self, event)
+
+    def wheelEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Zoom in or out around the cursor
+        """
+        position = event.position()
+        self.viewport.zoom(
+            self.ZOOM_STEP ** (event.angleDelta().y() / 120),
+            position.x(),
+            position.y(),
+        )
+        self.update()
+
+    def mousePressEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Start dragging the map
+        """
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.drag_start = event.position()
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+
+    def mouseMoveEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Drag the map
+        """
+        if self.drag_start is None:
+            return
+        position = event.position()
+        self.viewport.pan(
+            position.x() - self.drag_start.x(), position.y() - self.drag_start.y()
         )
-        self.setFixedSize(min_side, min_side)
-        self.setAutoFillBackground(True)
-        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.drag_start = position
+        self.update()
+
+    def mouseReleaseEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Stop dragging the map
+        """
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.drag_start = None
+            self.unsetCursor()
+
+    def mouseDoubleClickEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Fit the whole map to the widget
+        """
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.viewport.fit()
+            self.update()
+
+    def generate_map(self):
+        """
+        Start map's generation, requests the next step unless one is still in flight
+        """
+        if self.replay is not None:
+            if self.parent_.is_running:
+                self.parent_.toggle_update()
+            return
+        if self.in_flight or self.finishing:
+            return
+        self.in_flight = True
+        self.step_requested.emit()
+
+    def generate_instantly(self):
+        """
+        Generate the rest of the map at once, only the final map is painted
+        """
+        if self.replay is not None or self.finishing:
+            return
+        if self.parent_.is_running:
+            self.parent_.toggle_update()
+        self.finishing = True
+        self.finish_requested.emit()
+
+    def show_progress(self, phase, step):
+        """
+        Show the progress of an instant generation
+        """
+        info = self.parent_.side_panel.info
+        info.progress = f"{phase}, step {step}"
+        info.update_text()
+
+    def swap_frame(self):
+        """
+        Swap in the newest frame made by the worker
+        """
+        self.in_flight = False
+        frame = self.worker.take_frame()
+        if frame is None or self.parent_.grid is not self:
+            return
+        image, changes, is_stopped = frame
+        self.update_grid(image, changes)
+        if self.profiler.enabled:
+            # The paints since the last frame, the grid's last step is only replaced
+            # by the worker, never changed
+            self.profiler.end_step(self.profiler.steps, "paint")
+            info = self.parent_.side_panel.info
+            info.stats = self.grid.profiler.summary(self.profiler)
+            info.update_text()
+        if is_stopped and self.replay is None:
+            if self.parent_.is_running:
+                self.parent_.toggle_update()
+            self.finishing = False
+            side_panel = self.parent_.side_panel
+            side_panel.start_button.setEnabled(True)
+            side_panel.regenerate_button.setEnabled(True)
+            side_panel.instant_button.setEnabled(False)
+            side_panel.textures_button.setEnabled(True)
+            self.recorder.close()
+            self.replay = Replay(self.log_path)
+            side_panel.timeline_slider.reset(self.replay.steps)
 
-    def set_color(self, color):
+    def show_step(self, step):
         """
-        Set color of the cell
+        Show the map as it was after the given step of the generation
         """
-        palette = self.palette()
-        palette.setColor(self.backgroundRole(), color)
-        self.setPalette(palette)
+        if self.replay is None:
+            return
+        self.clear_textures()
+        self.redraw_grid(*self.replay.frame(step))
 
-    def set_texture(self, filepath):
+    def discard_recording(self):
         """
-        Set texture to cell
+        Stop the worker, it only ends the step or the exported row in flight, then
+        close and remove the generation's delta log
         """
-        pixmap = QPixmap(filepath)
-        self.setPixmap(pixmap)
-        self.setScaledContents(True)
+        self.worker.cancel()
+        self.thread.quit()
+        self.thread.wait()
+        self.recorder.close()
+        self.replay = None
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
 
-    def resize_(self):
+    def export_as_png(self):
         """
-        Resize cell
+        Export the shown map as a PNG of its colors or a 16-bit heightmap at the chosen
+        number of pixels per cell, the file is written on the worker's thread
+        Shown textures are drawn over the colors if cells are large enough for them
         """
-        min_side = min(
-            self.parent_.width() / self.size[0], self.parent_.height() / self.size[1]
+        file_name, file_filter = QFileDialog.getSaveFileName(
+            self,
+            "Save Image",
+            "",
+            f"{self.COLORS_FILTER};;{self.HEIGHTMAP_FILTER}",
+        )
+        if not file_name:
+            return
+        if not file_name.lower().endswith(".png"):
+            file_name += ".png"
+        scale, ok = QInputDialog.getInt(
+            self, "Export", "Pixels per cell:", 1, 1, self.MAX_EXPORT_SCALE
         )
-        self.setFixedSize(min_side, min_side)
+        if not ok:
+            return
+        frame = None
+        if self.replay is not None:
+            frame = self.replay.frame(self.parent_.side_panel.timeline_slider.value())
+        heightmap = file_filter == self.HEIGHTMAP_FILTER
+        textures = None
+        if not heightmap and scale >= self.MIN_TEXTURE_SIDE:
+            textures = dict(self.textures)
+        self.show_export_progress(0)
+        self.export_requested.emit(file_name, heightmap, scale, frame, textures)
+
+    def show_export_progress(self, percent):
+        """
+        Show the percentage of an export written
+        """
+        self.show_exported(f"{percent}%")
+
+    def show_exported(self, outcome):
+        """
+        Show how an export has ended
+        """
+        info = self.parent_.side_panel.info
+        info.progress = f"export {outcome}"
+        info.update_text()
@@ -37,10 +37,12 @@ class MainWindow(QMainWindow):
             self.side_panel, alignment=Qt.AlignmentFlag.AlignTop
         )
 
+        self.grid = None
         self.init_grid((28, 43), None)
 
         self.side_panel.info.seed = self.grid.grid.seed
         self.side_panel.info.size = (self.grid.n_rows, self.grid.n_cols)
+        self.side_panel.info.engine = self.grid.grid.ENGINE
         self.side_panel.info.delay = self.side_panel.delay_slider.value()
         self.side_panel.info.update_text()
 
@@ -66,7 +68,15 @@ class MainWindow(QMainWindow):
         """
         Init grid
         """
-        self.grid = GridWidget(*size, seed=seed, parent=self)
+        if self.grid is not None:
+            self.grid.discard_recording()
+        self.grid = GridWidget(
+            *size,
+            seed=seed,
+            engine=self.side_panel.engine_box.currentText(),
+            parent=self,
+        )
+        self.grid.enable_profiling(self.side_panel.profile_box.isChecked())
         self.window_layout.addWidget(self.grid, alignment=Qt.AlignmentFlag.AlignTop)
         self.grid.display_grid()
         self.timer = QTimer()
@@ -79,6 +89,13 @@ class MainWindow(QMainWindow):
         """
         cls.DELAY = new
 
+    def closeEvent(self, event):  # pylint: disable=invalid-name
+        """
+        Close
+        """
+        self.grid.discard_recording()
+        QMainWindow.closeEvent(self, event)
+
     def resizeEvent(self, event):
         """
         Resize
@@ -86,6 +103,4 @@ class MainWindow(QMainWindow):
         self.grid.setFixedSize(
             (int(1400 * self.width() / 1920)), (int(900 * self.height() / 1080))
         )
-        for cell in self.grid.cells:
-            cell.resize_()
         QMainWindow.resizeEvent(self, event)
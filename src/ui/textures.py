@@ -0,0 +1,169 @@
+"""
+Texture atlas
+"""
+
+import os
+from bisect import bisect
+from collections import OrderedDict
+from itertools import accumulate
+
+import numpy as np
+from PySide6.QtCore import QRectF, QSize, Qt
+from PySide6.QtGui import QImage, QPainter
+
+from cells import CELL_TYPES
+
+# Subtypes drawn over 2x2 cells of the same type when there is room for them, their
+# textures are numbered 1 to 4 in row order
+LARGE_SUBTYPES = ("pyramid", "wavy", "house", "ship")
+
+
+class TextureAtlas:
+    """
+    Every texture under the assets folder, loaded once on first use
+    Textures are named "<cell type>/<file name without extension>", scaled copies are
+    kept in a least recently used cache keyed by (texture, size)
+    """
+
+    def __init__(self, root: str = "assets", cache_size: int = 512) -> None:
+        self.root = root
+        self.cache_size = cache_size
+        self._images: dict[str, QImage] | None = None
+        self._scaled: OrderedDict[tuple[str, int], QImage] = OrderedDict()
+
+    def load(self) -> None:
+        """
+        Load all of the textures from disk
+        """
+        self._images = {}
+        for type_ in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, type_)
+            if type_.startswith(".") or not os.path.isdir(folder):
+                continue
+            for file_name in sorted(os.listdir(folder)):
+                name, ext = os.path.splitext(file_name)
+                if ext == ".png":
+                    image = QImage(os.path.join(folder, file_name))
+                    if not image.isNull():
+                        self._images[f"{type_}/{name}"] = image
+
+    def __contains__(self, name: str) -> bool:
+        if self._images is None:
+            self.load()
+        return name in self._images
+
+    def scaled(self, name: str, size: int) -> QImage | None:
+        """
+        Get a texture scaled to a square of the given size, None if there is no such one
+        """
+        key = (name, size)
+        if key in self._scaled:
+            self._scaled.move_to_end(key)
+            return self._scaled[key]
+        if name not in self:
+            return None
+        image = _scale(self._images[name], size)
+        self._scaled[key] = image
+        if len(self._scaled) > self.cache_size:
+            self._scaled.popitem(last=False)
+        return image
+
+    def composite(self, cells, rect, size: int, layer_size: QSize) -> QImage:
+        """
+        Draw textures of the cells, ((x, y), name) pairs, onto a single transparent
+        image of the given size, scaled to squares of size pixels and drawn into the
+        rectangles rect(x, y)
+        """
+        layer = QImage(layer_size, QImage.Format.Format_ARGB32_Premultiplied)
+        layer.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(layer)
+        for (x, y), name in cells:
+            image = self.scaled(name, size)
+            if image is not None:
+                painter.drawImage(rect(x, y), image)
+        painter.end()
+        return layer
+
+    def overlay(self, textures: dict, size: int):
+        """
+        Get an overlay of export.save_png drawing textures, {(x, y): name}, over the
+        cells of the map as squares of size pixels
+        It keeps its own scaled textures, so it can run on another thread than the one
+        drawing the map
+        """
+        if self._images is None:
+            self.load()
+        rows = {}
+        for (x, y), name in textures.items():
+            if name in self._images:
+                rows.setdefault(x, []).append((y, name))
+        images = {}
+
+        def draw(i, block):
+            if i not in rows:
+                return block
+            height, width = block.shape[:2]
+            strip = QImage(
+                block.tobytes(), width, height, width * 3, QImage.Format.Format_RGB888
+            ).copy()
+            painter = QPainter(strip)
+            for y, name in rows[i]:
+                if name not in images:
+                    images[name] = _scale(self._images[name], size)
+                painter.drawImage(QRectF(y * size, 0, size, size), images[name])
+            painter.end()
+            lines = np.frombuffer(strip.constBits(), np.uint8)
+            return lines.reshape(height, strip.bytesPerLine())[:, : width * 3].copy()
+
+        return draw
+
+
+def _scale(image: QImage, size: int) -> QImage:
+    return image.scaled(
+        size,
+        size,
+        Qt.AspectRatioMode.IgnoreAspectRatio,
+        Qt.TransformationMode.SmoothTransformation,
+    )
+
+
+ATLAS = TextureAtlas()
+
+
+def pick_textures(types: np.ndarray, rng) -> dict[tuple[int, int], str]:
+    """
+    Pick the textures of a map given as type codes, returns the texture names by cell
+    Every cell rolls its chance and its subtype from the rng stream at once, the picked
+    cells are then visited in row order and skipped if a cell of the same type next to
+    them already has a texture
+    """
+    n, m = types.shape
+    chance, subtype_rolls = rng.randoms(2 * n * m).reshape(2, n, m)
+    # Biomes without subtypes are never picked
+    probability = np.array(
+        [cls.PROBABILITY if cls.SUBTYPES else -1 for cls in CELL_TYPES]
+    )
+    cumulative = [list(accumulate(cls.SUBTYPES.values())) for cls in CELL_TYPES]
+    textures = {}
+    textured = np.zeros((n, m), dtype=bool)
+    for x, y in np.argwhere(chance <= probability[types]).tolist():
+        code = types[x, y]
+        around = (slice(max(x - 1, 0), x + 2), slice(max(y - 1, 0), y + 2))
+        if (textured[around] & (types[around] == code)).any():
+            continue
+        cls = CELL_TYPES[code]
+        weights = cumulative[code]
+        subtype = list(cls.SUBTYPES)[bisect(weights, subtype_rolls[x, y] * weights[-1])]
+        block = types[x : x + 2, y : y + 2]
+        if (
+            subtype in LARGE_SUBTYPES
+            and block.shape == (2, 2)
+            and (block == code).all()
+        ):
+            for index, (dx, dy) in enumerate(((0, 0), (0, 1), (1, 0), (1, 1))):
+                textures[(x + dx, y + dy)] = f"{cls.TYPE}/{subtype}{index + 1}"
+            textured[x : x + 2, y : y + 2] = True
+        else:
+            textures[(x, y)] = f"{cls.TYPE}/{subtype}"
+            textured[x, y] = True
+    return textures
@@ -0,0 +1,237 @@
+"""
+Zoomable view of the map and downsampled copies of its image
+"""
+
+import math
+
+import numpy as np
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QImage
+
+from grid import Changes
+
+
+class Viewport:
+    """
+    Visible window of a map in a widget
+    The cell (x, y) is drawn at (left + y * scale, top + x * scale) in widget
+    coordinates, the map can't be zoomed out beyond fitting the widget
+    """
+
+    MAX_SCALE = 64
+
+    def __init__(self, n_rows: int, n_cols: int) -> None:
+        self.n_rows, self.n_cols = n_rows, n_cols
+        self.width, self.height = 0, 0
+        self.scale, self.left, self.top = 1.0, 0.0, 0.0
+        self.fitted = True
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resize the view, a fitted map stays fitted
+        """
+        self.width, self.height = width, height
+        if self.fitted:
+            self.fit()
+        else:
+            self.scale = max(self.scale, self.fit_scale())
+            self.clamp()
+
+    def fit_scale(self) -> float:
+        """
+        Side of a cell in pixels when the whole map is shown
+        """
+        return min(self.width / self.n_cols, self.height / self.n_rows)
+
+    def fit(self) -> None:
+        """
+        Show the whole map
+        """
+        self.scale = self.fit_scale()
+        self.fitted = True
+        self.clamp()
+
+    def zoom(self, factor: float, x: float, y: float) -> None:
+        """
+        Zoom by a factor keeping the point (x, y) of the widget in place
+        """
+        low = self.fit_scale()
+        scale = min(max(self.scale * factor, low), max(self.MAX_SCALE, low))
+        self.left = x - (x - self.left) * scale / self.scale
+        self.top = y - (y - self.top) * scale / self.scale
+        self.scale = scale
+        self.fitted = scale == low
+        self.clamp()
+
+    def pan(self, dx: float, dy: float) -> None:
+        """
+        Move the map by (dx, dy) pixels
+        """
+        self.left += dx
+        self.top += dy
+        self.clamp()
+
+    def clamp(self) -> None:
+        """
+        Keep the map over the widget, a map narrower than the widget is centered and a
+        lower one is aligned to its top
+        """
+        width, height = self.scale * self.n_cols, self.scale * self.n_rows
+        if width <= self.width:
+            self.left = (self.width - width) / 2
+        else:
+            self.left = min(max(self.left, self.width - width), 0)
+        if height <= self.height:
+            self.top = 0
+        else:
+            self.top = min(max(self.top, self.height - height), 0)
+
+    def cell_rect(self, x: int, y: int, rows: int = 1, cols: int = 1) -> QRectF:
+        """
+        Rectangle of a cell, or of a block of cells, in widget's coordinates
+        """
+        return QRectF(
+            self.left + y * self.scale,
+            self.top + x * self.scale,
+            cols * self.scale,
+            rows * self.scale,
+        )
+
+    def visible(self) -> tuple[int, int, int, int]:
+        """
+        Visible cells as (first row, last row + 1, first column, last column + 1)
+        """
+        return (
+            max(0, math.floor(-self.top / self.scale)),
+            min(self.n_rows, math.ceil((self.height - self.top) / self.scale)),
+            max(0, math.floor(-self.left / self.scale)),
+            min(self.n_cols, math.ceil((self.width - self.left) / self.scale)),
+        )
+
+    def level(self) -> int:
+        """
+        Level of the mip pyramid to draw, the coarsest one whose pixels are at most as
+        large as the widget's
+        """
+        if self.scale >= 1:
+            return 0
+        return math.floor(math.log2(1 / self.scale))
+
+
+def _pixels(image: QImage) -> np.ndarray:
+    """
+    View of the pixels of an RGB32 image as 0xFFRRGGBB integers
+    """
+    rows = np.frombuffer(image.constBits(), np.uint32)
+    rows = rows.reshape(image.height(), image.bytesPerLine() // 4)
+    return rows[:, : image.width()]
+
+
+def _average(blocks: list[np.ndarray]) -> np.ndarray:
+    """
+    Average color of four pixels given as arrays of the same shape
+    """
+    channels = [
+        sum((block >> shift & 0xFF).astype(np.uint16) for block in blocks)
+        for shift in (16, 8, 0)
+    ]
+    red, green, blue = ((channel + 2) // 4 for channel in channels)
+    return 0xFF000000 | red.astype(np.uint32) << 16 | green << 8 | blue
+
+
+def _downsample(parent: np.ndarray) -> np.ndarray:
+    """
+    Next level of a whole level, blocks over the edge repeat its last pixels
+    """
+    n, m = parent.shape
+    padded = np.pad(parent, ((0, n % 2), (0, m % 2)), mode="edge")
+    return _average([padded[dx::2, dy::2] for dx in (0, 1) for dy in (0, 1)])
+
+
+def _downsample_at(parent: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """
+    Given pixels of the next level of a level
+    """
+    n, m = parent.shape
+    return _average(
+        [
+            parent[np.minimum(2 * xs + dx, n - 1), np.minimum(2 * ys + dy, m - 1)]
+            for dx in (0, 1)
+            for dy in (0, 1)
+        ]
+    )
+
+
+class MipPyramid:
+    """
+    The map's image with one pixel per cell and its downsampled copies, level n has a
+    pixel per 2**n x 2**n cells with their average color
+    Levels are made the first time they are drawn, afterwards only their pixels over
+    the changed cells are recomputed, once they are drawn again
+    """
+
+    def __init__(self) -> None:
+        self.image = QImage()
+        # level: (pixels, changes since the level was last drawn)
+        self._levels: dict[int, tuple[np.ndarray, list[Changes]]] = {}
+        self._images: dict[int, QImage] = {}
+
+    def set_image(self, image: QImage, changes: Changes | None = None) -> None:
+        """
+        Set the map's image, only the given cells have changed unless changes is None
+        """
+        self.image = image
+        self._images.clear()
+        if changes is None:
+            self._levels.clear()
+            return
+        for level, (pixels, pending) in list(self._levels.items()):
+            pending.append(changes)
+            # A level that isn't drawn for long is made again rather than updated
+            if sum(len(changes.x) for changes in pending) > pixels.size:
+                del self._levels[level]
+
+    def depth(self) -> int:
+        """
+        Level with a single pixel on its longer side
+        """
+        return (max(self.image.width(), self.image.height(), 1) - 1).bit_length()
+
+    def level(self, level: int) -> QImage:
+        """
+        Get the image of a level, at most the deepest one
+        """
+        level = min(level, self.depth())
+        if level == 0 or self.image.isNull():
+            return self.image
+        if level not in self._images:
+            pixels = self._refresh(level)
+            self._images[level] = QImage(
+                pixels.data,
+                pixels.shape[1],
+                pixels.shape[0],
+                QImage.Format.Format_RGB32,
+            )
+        return self._images[level]
+
+    def _refresh(self, level: int) -> np.ndarray:
+        parent = _pixels(self.image) if level == 1 else self._refresh(level - 1)
+        if level not in self._levels:
+            pixels = _downsample(parent)
+            self._levels[level] = (pixels, [])
+            return pixels
+        pixels, pending = self._levels[level]
+        if pending:
+            m = pixels.shape[1]
+            index = np.unique(
+                np.concatenate(
+                    [
+                        (changes.x >> level) * m + (changes.y >> level)
+                        for changes in pending
+                    ]
+                )
+            )
+            xs, ys = np.divmod(index, m)
+            pixels[xs, ys] = _downsample_at(parent, xs, ys)
+            pending.clear()
+        return pixels
@@ -2,9 +2,9 @@
 Side panel widgets
 """
 
-import random
-from PySide6.QtGui import QPixmap
 from PySide6.QtWidgets import (
+    QCheckBox,
+    QComboBox,
     QWidget,
     QVBoxLayout,
     QHBoxLayout,
@@ -16,6 +16,9 @@ from PySide6.QtWidgets import (
 
 from PySide6.QtCore import Qt
 
+from engines import ENGINES, available
+from ui.textures import pick_textures
+
 
 class SidePanelWidget(QWidget):
     """
@@ -43,14 +46,20 @@ class SidePanelWidget(QWidget):
         self.size_box_layout.addWidget(self.size_input_n)
         self.size_box_layout.setContentsMargins(0, 0, 0, 0)
         self.size_box.setLayout(self.size_box_layout)
+        self.engine_label = EngineLabel()
+        self.engine_box = EngineBox(self)
 
         self.delay_label = DelayLabel()
         self.delay_slider = DelaySlider(self)
+        self.timeline_label = TimelineLabel()
+        self.timeline_slider = TimelineSlider(self)
+        self.profile_box = ProfileCheckBox(self)
 
         self.info_title = Subtitle("Info")
         self.info = Info(self)
         self.regenerate_button = RegenerateButton(self)
         self.start_button = ToggleButton(self)
+        self.instant_button = InstantButton(self)
         self.textures_button = ApplyTexturesButton(self)
         self.export_button = ExportButton(self)
 
@@ -68,10 +77,21 @@ class SidePanelWidget(QWidget):
         self.top_layout.addWidget(self.seed_input, alignment=Qt.AlignmentFlag.AlignTop)
         self.top_layout.addWidget(self.size_label, alignment=Qt.AlignmentFlag.AlignTop)
         self.top_layout.addWidget(self.size_box, alignment=Qt.AlignmentFlag.AlignTop)
+        self.top_layout.addWidget(
+            self.engine_label, alignment=Qt.AlignmentFlag.AlignTop
+        )
+        self.top_layout.addWidget(self.engine_box, alignment=Qt.AlignmentFlag.AlignTop)
         self.top_layout.addWidget(self.delay_label, alignment=Qt.AlignmentFlag.AlignTop)
         self.top_layout.addWidget(
             self.delay_slider, alignment=Qt.AlignmentFlag.AlignTop
         )
+        self.top_layout.addWidget(
+            self.timeline_label, alignment=Qt.AlignmentFlag.AlignTop
+        )
+        self.top_layout.addWidget(
+            self.timeline_slider, alignment=Qt.AlignmentFlag.AlignTop
+        )
+        self.top_layout.addWidget(self.profile_box, alignment=Qt.AlignmentFlag.AlignTop)
         self.top_layout.addWidget(self.regenerate_button)
         self.top_section.setLayout(self.top_layout)
 
@@ -81,6 +101,9 @@ class SidePanelWidget(QWidget):
         self.bottom_layout.addWidget(
             self.start_button, alignment=Qt.AlignmentFlag.AlignBottom
         )
+        self.bottom_layout.addWidget(
+            self.instant_button, alignment=Qt.AlignmentFlag.AlignBottom
+        )
         self.bottom_layout.addWidget(
             self.textures_button, alignment=Qt.AlignmentFlag.AlignBottom
         )
@@ -135,6 +158,26 @@ class ToggleButton(QPushButton):
         self.parent_ = parent
 
 
+class InstantButton(QPushButton):
+    """
+    Generate instantly button, runs the rest of the generation without rendering it
+    """
+
+    def __init__(self, parent=None):
+        super().__init__("Generate instantly")
+        self.parent_ = parent
+        self.clicked.connect(self.on_click)
+
+    def on_click(self):
+        """
+        Generate instantly, on click event
+        """
+        self.setEnabled(False)
+        self.parent_.start_button.setEnabled(False)
+        self.parent_.regenerate_button.setEnabled(False)
+        self.parent_.parent_.grid.generate_instantly()
+
+
 class SeedInputLabel(QLabel):
     """
     Label of the seed input window
@@ -163,6 +206,30 @@ class SeedInput(QLineEdit):
         self.setStyleSheet("SeedInput {}")
 
 
+class EngineLabel(QLabel):
+    """
+    Label of the engine choice
+    """
+
+    def __init__(self):
+        super().__init__("Engine")
+        self.setContentsMargins(0, 0, 0, 0)
+
+
+class EngineBox(QComboBox):
+    """
+    Simulation engine of the next map, engines that can't run here are disabled
+    """
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.parent_ = parent
+        for index, name in enumerate(ENGINES):
+            self.addItem(name)
+            if not available(name):
+                self.model().item(index).setEnabled(False)
+
+
 class DelayLabel(QLabel):
     """
     Delay adjustment label
@@ -198,6 +265,68 @@ class DelaySlider(QSlider):
         info.update_text()
 
 
+class TimelineLabel(QLabel):
+    """
+    Generation timeline label
+    """
+
+    def __init__(self):
+        super().__init__("Timeline")
+        self.setContentsMargins(0, 0, 0, 0)
+
+
+class TimelineSlider(QSlider):
+    """
+    Generation timeline slider, replays any step of a finished generation
+    """
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.parent_ = parent
+        self.setOrientation(Qt.Horizontal)
+        self.setRange(0, 0)
+        self.setEnabled(False)
+        self.valueChanged.connect(self.on_change)
+
+    def reset(self, steps=None):
+        """
+        Set the timeline up for a generation of the given number of steps, disables
+        the timeline if there is none
+        """
+        self.blockSignals(True)
+        self.setRange(0, steps or 0)
+        self.setValue(steps or 0)
+        self.blockSignals(False)
+        self.setEnabled(steps is not None)
+
+    def on_change(self):
+        """
+        Show the chosen step
+        """
+        self.parent_.parent_.grid.show_step(self.value())
+        self.parent_.textures_button.setEnabled(self.value() == self.maximum())
+
+
+class ProfileCheckBox(QCheckBox):
+    """
+    Profiling toggle, shows the timing and counters of every step in the info
+    """
+
+    def __init__(self, parent=None):
+        super().__init__("Profiling")
+        self.parent_ = parent
+        self.toggled.connect(self.on_toggle)
+
+    def on_toggle(self, checked):
+        """
+        Enable or disable the grid's profilers
+        """
+        self.parent_.parent_.grid.enable_profiling(checked)
+        info = self.parent_.info
+        info.stats = None
+        info.update_text()
+
+
 class RegenerateButton(QPushButton):
     """
     Regenerate seed button
@@ -230,11 +359,16 @@ class RegenerateButton(QPushButton):
             info = self.parent_.info
             info.seed = seed
             info.size = size
-            info.update_text()
+            info.progress = None
+            info.stats = None
 
             grid.setParent(None)
             self.parent_.textures_button.setEnabled(False)
+            self.parent_.instant_button.setEnabled(True)
+            self.parent_.timeline_slider.reset()
             self.parent_.parent_.init_grid(size, seed)
+            info.engine = self.parent_.parent_.grid.grid.ENGINE
+            info.update_text()
 
 
 class ExportButton(QPushButton):
@@ -246,6 +380,13 @@ class ExportButton(QPushButton):
         super().__init__(parent=parent)
         self.parent_ = parent
         self.setText("Export")
+        self.clicked.connect(self.on_click)
+
+    def on_click(self):
+        """
+        Export the map of the current grid, on click event
+        """
+        self.parent_.parent_.grid.export_as_png()
 
 
 class SizeLabel(QLabel):
@@ -263,6 +404,9 @@ class SizeField(QLineEdit):
     Size input field
     """
 
+    MIN_SIZE = 10
+    MAX_SIZE = 500
+
     def __init__(self, parent=None) -> None:
         super().__init__()
         self.parent_ = parent
@@ -285,7 +429,7 @@ class SizeField(QLineEdit):
             except Exception:
                 self.setStyleSheet("SizeField { background-color: red; }")
                 return False
-            if num not in range(10, 101):
+            if num not in range(self.MIN_SIZE, self.MAX_SIZE + 1):
                 self.setStyleSheet("SizeField { background-color: red; }")
                 return False
         return True
@@ -301,17 +445,24 @@ class Info(QLabel):
         self.parent_ = parent
         self.seed = None
         self.size = None
+        self.engine = None
         self.delay = None
+        self.progress = None
+        self.stats = None
 
     def update_text(self):
         """
         Update info text
         """
-        self.setText(
-            f"""Seed: {self.seed}
+        text = f"""Seed: {self.seed}
 Map's size: {self.size[1]}x{self.size[0]}
+Engine: {self.engine}
 Delay: {self.delay}"""
-        )
+        if self.progress:
+            text += f"\nProgress: {self.progress}"
+        if self.stats:
+            text += f"\n{self.stats}"
+        self.setText(text)
 
 
 class ApplyTexturesButton(QPushButton):
@@ -330,32 +481,4 @@ class ApplyTexturesButton(QPushButton):
         Apply textures, on click event
         """
         grid = self.parent_.parent_.grid
-        for i, cell_ in enumerate(grid.cells):
-            cell_.setPixmap(QPixmap())
-            cell = grid.grid[i // grid.n_cols][i % grid.n_cols]
-            cell.texture = False
-        for i, cell_ in enumerate(grid.cells):
-            cell = grid.grid[i // grid.n_cols][i % grid.n_cols]
-            if cell.texture or random.random() > cell.probability:
-                continue
-            large_subtypes = ["pyramid", "wavy", "house", "ship"]
-            texture_neighbours = [
-                n
-                for n in grid.grid.get_adjacent(cell)
-                if n.type == cell.type and n.texture
-            ]
-            if len(texture_neighbours) == 0:
-                subtype = cell.get_subtype()
-                if subtype in large_subtypes and grid.grid.large_texture(cell):
-                    cells_directions = [0, 1, grid.n_cols, grid.n_cols + 1]
-                    for n, c in enumerate(cells_directions):
-                        curr_cell = grid.cells[i + c]
-                        texture_path = f"assets/{cell.type}/{subtype}{n + 1}.png"
-                        curr_cell.set_texture(texture_path)
-                    cells = [(0, 0), (0, 1), (1, 0), (1, 1)]
-                    for n, m in cells:
-                        grid.grid[cell.x + n][cell.y + m].texture = True
-                else:
-                    texture_path = f"assets/{cell.type}/{subtype}.png"
-                    cell_.set_texture(texture_path)
-                    cell.texture = True
+        grid.set_textures(pick_textures(grid.grid.type_array(), grid.grid.texture_rng))
@@ -0,0 +1,165 @@
+"""
+Simulation worker
+"""
+
+import os
+import threading
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal, Slot
+from PySide6.QtGui import QImage
+
+from export import save_heightmap, save_png
+from grid import Changes, Grid
+from palette import to_packed
+from replay import DeltaRecorder
+from ui.textures import ATLAS
+
+
+def render(types: np.ndarray, height: np.ndarray) -> QImage:
+    """
+    Draw a whole map as an image with one pixel per cell
+    """
+    n_rows, n_cols = types.shape
+    pixels = np.ascontiguousarray(to_packed(types, height) | 0xFF000000, np.uint32)
+    return QImage(pixels.data, n_cols, n_rows, QImage.Format.Format_RGB32).copy()
+
+
+def is_full_redraw(changes: Changes, n_rows: int, n_cols: int) -> bool:
+    """
+    Whether so many cells have changed that the whole map should be redrawn
+    """
+    return len(changes.x) > n_rows * n_cols // 8
+
+
+class _Cancelled(Exception):
+    """
+    Raised to stop an export once the worker is cancelled
+    """
+
+
+class StepWorker(QObject):
+    """
+    Steps the grid on its own thread and draws every step into a back buffer
+    The newest completed frame is handed over to the UI thread, which only swaps it
+    in and paints it
+    """
+
+    frame_ready = Signal()
+    progress = Signal(str, int)
+    export_progress = Signal(int)
+    exported = Signal(str)
+
+    def __init__(self, grid: Grid, recorder: DeltaRecorder) -> None:
+        super().__init__()
+        self.grid = grid
+        self.recorder = recorder
+        self._back = QImage()
+        self.is_done = False
+        self._frame = None
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        """
+        Stop the work of the worker after the step or the exported row in flight, and
+        any work requested later, can be called from any thread
+        """
+        self._cancelled.set()
+
+    @Slot()
+    def step(self) -> None:
+        """
+        Make a single step of the generation and publish its frame
+        """
+        if self.is_done or self._cancelled.is_set():
+            return
+        is_stopped = self.grid.update_grid()
+        changes = self.grid.pop_changes()
+        self.recorder.record(changes)
+        with self.grid.profiler.phase("render"):
+            if self._back.isNull() or is_full_redraw(
+                changes, self.grid.n_rows, self.grid.n_cols
+            ):
+                self._back = render(self.grid.type_array(), self.grid.height_array())
+            else:
+                packed = to_packed(changes.types, changes.height) | 0xFF000000
+                for x, y, rgb in zip(
+                    changes.x.tolist(), changes.y.tolist(), packed.tolist()
+                ):
+                    self._back.setPixel(y, x, rgb)
+        self.grid.profiler.end_step(self.grid.step, self.grid.phase)
+        self._publish(changes, is_stopped)
+
+    @Slot()
+    def finish(self) -> None:
+        """
+        Run the rest of the generation at once and publish only its final frame
+        """
+        if self.is_done or self._cancelled.is_set():
+            return
+        # Progress is shown as the number of steps since the start, not since the click
+        self.grid.run_to_completion(
+            lambda phase, _: self.progress.emit(phase, self.recorder.step),
+            self.recorder,
+            cancelled=self._cancelled.is_set,
+        )
+        if self._cancelled.is_set():
+            return
+        self._back = render(self.grid.type_array(), self.grid.height_array())
+        self._publish(None, True)
+
+    @Slot(str, bool, int, object, object)
+    def export(  # pylint: disable=too-many-arguments
+        self, path: str, heightmap: bool, scale: int, frame, textures
+    ) -> None:
+        """
+        Export the map, or the given frame as (types, heights), as a PNG of its colors
+        or a 16-bit heightmap with scale x scale pixels per cell
+        The colors are drawn with the given textures, {(x, y): name}, on top
+        Runs between steps, the percentage of rows written is reported as it goes
+        """
+        if frame is None:
+            frame = self.grid.type_array(), self.grid.height_array()
+        types, height = frame
+        shown = -1
+
+        def report(done, total):
+            nonlocal shown
+            if self._cancelled.is_set():
+                raise _Cancelled
+            if done * 100 // total != shown:
+                shown = done * 100 // total
+                self.export_progress.emit(shown)
+
+        try:
+            if heightmap:
+                save_heightmap(height, path, scale, report)
+            else:
+                overlay = ATLAS.overlay(textures, scale) if textures else None
+                save_png(types, height, path, scale, report, overlay)
+        except OSError as error:
+            self.exported.emit(f"failed, {error.strerror or error}")
+            return
+        except _Cancelled:
+            os.remove(path)
+            return
+        self.exported.emit(f"saved {path}")
+
+    def _publish(self, changes: Changes | None, is_stopped: bool) -> None:
+        self.is_done = is_stopped
+        with self._lock:
+            # Cells changed in a frame that was never taken are only in the image
+            if self._frame is not None:
+                changes = None
+            self._frame = (self._back.copy(), changes, is_stopped)
+        self.frame_ready.emit()
+
+    def take_frame(self) -> tuple[QImage, Changes | None, bool] | None:
+        """
+        Take the newest completed frame, None if it has already been taken
+        Its changes are None if the whole map has to be repainted
+        """
+        with self._lock:
+            frame, self._frame = self._frame, None
+        return frame
@@ -0,0 +1,132 @@
+"""
+Infinite world made of lazily generated chunks
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+from grid import Grid, starting_biomes
+from rng import GENERATION, PLACEMENT, Stream, stream_key
+
+
+class Chunk(NamedTuple):
+    """
+    Generated chunk, type codes and heights of its cells
+    """
+
+    types: np.ndarray
+    height: np.ndarray
+
+
+class ChunkGrid(Grid):
+    """
+    Grid of a single chunk surrounded by halo cells
+    The starting biomes of the neighbouring chunks that fall into the halo are placed
+    as well, so biomes that start next to a border grow across it
+    """
+
+    def __init__(self, world: "World", cx: int, cy: int) -> None:
+        self.world = world
+        self.chunk = (cx, cy)
+        size = world.chunk_size + 2 * world.halo
+        super().__init__(size, size, world.chunk_seed(cx, cy))
+
+    def initial_biomes(self, rng=None):  # pylint: disable=unused-argument
+        """
+        Get coordinates and classes of the starting biome cells of this chunk and
+        of the neighbouring ones, in this grid's coordinates
+        """
+        cx, cy = self.chunk
+        size, halo = self.world.chunk_size, self.world.halo
+        res = {}
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for (x, y), cls in self.world.chunk_biomes(cx + dx, cy + dy):
+                    new = (x + dx * size + halo, y + dy * size + halo)
+                    if 0 <= new[0] < self.n_rows and 0 <= new[1] < self.n_cols:
+                        res.setdefault(new, cls)
+        return list(res.items())
+
+    def crop(self) -> Chunk:
+        """
+        Get the chunk without its halo
+        """
+        inner = slice(self.world.halo, self.world.halo + self.world.chunk_size)
+        return Chunk(self.type_array()[inner, inner], self.height_array()[inner, inner])
+
+
+class World:
+    """
+    Infinite world, chunks are generated on demand and the most recently used ones
+    are kept in memory
+    """
+
+    def __init__(
+        self,
+        seed: str | None = None,
+        chunk_size: int = 32,
+        halo: int = 8,
+        max_chunks: int = 64,
+    ) -> None:
+        if not 0 <= halo <= chunk_size:
+            raise ValueError("halo must be between 0 and the chunk size")
+        self.seed = seed if seed else Grid.generate_seed()
+        self.chunk_size = chunk_size
+        self.halo = halo
+        self.max_chunks = max_chunks
+        self._chunks: OrderedDict[tuple[int, int], Chunk] = OrderedDict()
+
+    def chunk_seed(self, cx: int, cy: int) -> str:
+        """
+        Get the seed of a chunk, derived from the world's seed
+        """
+        digest = hashlib.sha256(f"{self.seed}:{cx}:{cy}".encode()).hexdigest()
+        return digest[:20]
+
+    def chunk_biomes(self, cx: int, cy: int) -> list[tuple[tuple[int, int], type]]:
+        """
+        Get the starting biome cells of a chunk in the chunk's coordinates
+        """
+        rng = Stream(stream_key(self.chunk_seed(cx, cy), GENERATION), PLACEMENT, 0)
+        return starting_biomes(rng, self.chunk_size, self.chunk_size)
+
+    def chunk(self, cx: int, cy: int) -> Chunk:
+        """
+        Get a chunk, generating it if it is not in memory
+        """
+        key = (cx, cy)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+        grid = ChunkGrid(self, cx, cy)
+        while not grid.update_grid():
+            pass
+        self._chunks[key] = grid.crop()
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return self._chunks[key]
+
+    def region(self, x: int, y: int, rows: int, cols: int) -> Chunk:
+        """
+        Get an area of the world, only the chunks it overlaps are generated
+        """
+        types = np.empty((rows, cols), dtype=np.uint8)
+        height = np.empty((rows, cols), dtype=float)
+        size = self.chunk_size
+        for cx in range(x // size, (x + rows - 1) // size + 1):
+            for cy in range(y // size, (y + cols - 1) // size + 1):
+                chunk = self.chunk(cx, cy)
+                top, left = max(x, cx * size), max(y, cy * size)
+                bottom = min(x + rows, (cx + 1) * size)
+                right = min(y + cols, (cy + 1) * size)
+                src = (
+                    slice(top - cx * size, bottom - cx * size),
+                    slice(left - cy * size, right - cy * size),
+                )
+                dst = (slice(top - x, bottom - x), slice(left - y, right - y))
+                types[dst] = chunk.types[src]
+                height[dst] = chunk.height[src]
+        return Chunk(types, height)
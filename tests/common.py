@@ -0,0 +1,42 @@
+"""
+Helpers of the tests
+"""
+
+import os
+
+import numpy as np
+
+import snapshot
+
+# Steps after which a generation is taken to hang, the maps of the tests need a few
+# hundred
+MAX_STEPS = 5000
+
+
+def run(grid, max_steps: int = MAX_STEPS) -> int:
+    """
+    Step a grid until all of its phases are over, returns the number of steps
+    """
+    for steps in range(1, max_steps + 1):
+        if grid.update_grid():
+            return steps
+    raise AssertionError(f"the {grid.ENGINE} grid of seed {grid.seed!r} hangs")
+
+
+def state(grid, folder) -> dict:
+    """
+    Full state of a grid, as saved in its snapshot, the phase and step included
+    """
+    path = os.path.join(folder, f"state{len(os.listdir(folder))}.snap")
+    grid.save_snapshot(path)
+    meta, arrays = snapshot.read(path)
+    return {**meta, **{name: np.array(array) for name, array in arrays.items()}}
+
+
+def assert_same(first: dict, second: dict) -> None:
+    """
+    Check that two states of a map are equal
+    """
+    assert first.keys() == second.keys()
+    for name, value in first.items():
+        np.testing.assert_array_equal(value, second[name], err_msg=name)
@@ -0,0 +1,37 @@
+"""
+Shared fixtures, the modules are imported from src like the entry points do
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+# pylint: disable=wrong-import-position
+from engines import ENGINES, available, make_grid
+
+
+@pytest.fixture(params=[name for name in ENGINES if available(name)])
+def engine(request) -> str:
+    """
+    Every engine that can run here
+    """
+    return request.param
+
+
+@pytest.fixture
+def new_grid():
+    """
+    Create grids with make_grid, they are closed after the test
+    """
+    grids = []
+
+    def create(*args, **kwargs):
+        grids.append(make_grid(*args, **kwargs))
+        return grids[-1]
+
+    yield create
+    for grid in grids:
+        grid.close()
@@ -0,0 +1,38 @@
+"""
+Batches of maps generated in a process pool
+"""
+
+import numpy as np
+
+from batch import generate, generate_batch
+
+SEEDS = ["0", "batch", "7"]
+
+
+def test_batch_matches_serial(engine, tmp_path):
+    """
+    Every map of a batch is written once, and is the map generated for its seed in
+    this process
+    """
+    progress = []
+    written = dict(
+        generate_batch(
+            SEEDS,
+            15,
+            20,
+            str(tmp_path),
+            ("npz", "png"),
+            workers=2,
+            progress_cb=lambda done, total, _: progress.append((done, total)),
+            engine=engine,
+        )
+    )
+    assert sorted(written) == sorted(SEEDS)
+    assert progress == [(done, len(SEEDS)) for done in range(1, len(SEEDS) + 1)]
+    for seed, paths in written.items():
+        assert [path.rsplit(".", 1)[1] for path in paths] == ["npz", "png"]
+        grid = generate(15, 20, seed, engine=engine)
+        with np.load(paths[0]) as saved:
+            assert str(saved["seed"]) == seed
+            np.testing.assert_array_equal(saved["types"], grid.type_array())
+            np.testing.assert_array_equal(saved["height"], grid.height_array())
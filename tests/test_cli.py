@@ -0,0 +1,91 @@
+"""
+Command line interface
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batch import generate
+from cli import main
+
+
+def _load(path):
+    with np.load(path) as saved:
+        return saved["types"], saved["height"]
+
+
+def test_generate(tmp_path, capsys):
+    """
+    A map is written to every output, is the map of its seed, and its steps are
+    recorded for a replay
+    """
+    npz, png = str(tmp_path / "map.npz"), str(tmp_path / "map.png")
+    heightmap, log = str(tmp_path / "height.png"), str(tmp_path / "map.tglog")
+    args = ["generate", "--seed", "cli", "--size", "20x12", "--out", npz, "--out", png]
+    args += ["--scale", "2", "--heightmap", heightmap, "--record", log]
+    assert main(args) == 0
+    output = capsys.readouterr().out
+    assert "Seed: cli\nMap's size: 20x12\nEngine: reference\n" in output
+    grid = generate(12, 20, "cli")
+    types, height = _load(npz)
+    np.testing.assert_array_equal(types, grid.type_array())
+    np.testing.assert_array_equal(height, grid.height_array())
+    for path in (png, heightmap):
+        with Image.open(path) as image:
+            assert image.size == (40, 24)
+
+    replayed = str(tmp_path / "replayed.npz")
+    assert main(["replay", "--log", log, "--out", replayed]) == 0
+    steps = capsys.readouterr().out.split()[-1]
+    for saved, expected in zip(_load(replayed), (types, height)):
+        np.testing.assert_array_equal(saved, expected)
+    assert main(["replay", "--log", log, "--step", "0", "--out", replayed]) == 0
+    assert capsys.readouterr().out == f"Step 0 of {steps}\n"
+    assert np.count_nonzero(_load(replayed)[0]) == 3
+
+
+def test_batch(tmp_path, capsys):
+    """
+    A batch writes a map for every seed, listed or in a range
+    """
+    args = ["batch", "--seeds", "a", "b", "--range", "0:2", "--size", "10x8"]
+    args += ["--out", str(tmp_path), "--format", "npz", "--format", "png", "--quiet"]
+    assert main(args) == 0
+    assert capsys.readouterr().out.startswith("Generated 4 maps in ")
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"{seed}.{fmt}" for seed in ("0", "1", "a", "b") for fmt in ("npz", "png")
+    ]
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["--size", "1x1"], "a map needs at least 3 cells"),
+        (["--size", "0x5"], "must be positive"),
+        (["--size", "5"], "expected COLSxROWS"),
+        (["--workers", "2"], "--workers needs the numpy or numba engine"),
+        (["--workers", "0"], "--workers must be at least 1"),
+        (["--scale", "0"], "--scale must be at least 1"),
+        (["--heightmap", "height.tif"], "the heightmap has to be a .png"),
+        (["--out", "map.jpg"], "unsupported output format: map.jpg"),
+    ],
+)
+def test_invalid_generate(tmp_path, capsys, args, message):
+    """
+    Invalid arguments are usage errors, nothing is generated
+    """
+    with pytest.raises(SystemExit) as error:
+        main(["generate", "--out", str(tmp_path / "map.npz"), *args])
+    assert error.value.code == 2
+    assert message in capsys.readouterr().err
+    assert not any(tmp_path.iterdir())
+
+
+def test_batch_without_seeds(tmp_path, capsys):
+    """
+    A batch without any seed is a usage error
+    """
+    with pytest.raises(SystemExit):
+        main(["batch", "--out", str(tmp_path)])
+    assert "no seeds given" in capsys.readouterr().err
@@ -0,0 +1,90 @@
+"""
+Generation on every engine and agreement of the engines
+"""
+
+import numpy as np
+import pytest
+
+from array_grid import ArrayGrid
+from engines import available, make_grid
+from grid import Grid
+from tests.common import run
+
+SEEDS = [str(seed) for seed in range(20)]
+
+
+@pytest.mark.parametrize(
+    "rows, cols", [(1, 3), (3, 1), (2, 2), (5, 7), (10, 10), (20, 30), (28, 43)]
+)
+def test_generation_ends(engine, new_grid, rows, cols):
+    """
+    Every phase ends for a sweep of seeds, the array engines used to wait for young
+    land cells even when they had no neighbour left to infect
+    """
+    for seed in SEEDS:
+        run(new_grid(engine, rows, cols, seed))
+
+
+@pytest.mark.skipif(not available("numba"), reason="numba is not installed")
+@pytest.mark.parametrize("seed", SEEDS[:5])
+def test_numba_matches_numpy(new_grid, seed):
+    """
+    The numba engine makes the same maps in as many steps as the numpy one
+    """
+    numpy_grid = new_grid("numpy", 30, 40, seed)
+    numba_grid = new_grid("numba", 30, 40, seed)
+    assert run(numpy_grid) == run(numba_grid)
+    assert (numpy_grid.type_array() == numba_grid.type_array()).all()
+    assert (numpy_grid.height_array() == numba_grid.height_array()).all()
+
+
+def test_unknown_engine():
+    """
+    An unknown engine is an error rather than a fallback
+    """
+    with pytest.raises(ValueError):
+        make_grid("cuda", 10, 10)
+
+
+@pytest.mark.parametrize("rows, cols", [(1, 1), (1, 2), (2, 1)])
+def test_too_small_map(engine, rows, cols):
+    """
+    A map with fewer cells than starting biomes is an error, drawing them never ended
+    """
+    with pytest.raises(ValueError):
+        make_grid(engine, rows, cols, "small")
+
+
+@pytest.mark.parametrize("seed", SEEDS[:3])
+def test_frontier_matches_full_scan(new_grid, monkeypatch, seed):
+    """
+    Visiting only the frontier makes the same maps in as many steps as re-evaluating
+    every cell of the map
+    """
+    frontier = new_grid("reference", 20, 30, seed)
+    steps = run(frontier)
+    refresh = Grid._refresh_frontier  # pylint: disable=protected-access
+
+    def full_scan(grid, candidates):  # pylint: disable=unused-argument
+        refresh(grid, np.ndindex(grid.n_rows, grid.n_cols))
+
+    monkeypatch.setattr(Grid, "_refresh_frontier", full_scan)
+    scanned = new_grid("reference", 20, 30, seed)
+    assert run(scanned) == steps
+    assert (scanned.type_array() == frontier.type_array()).all()
+    assert (scanned.height_array() == frontier.height_array()).all()
+
+
+@pytest.mark.parametrize("seed", SEEDS[:3])
+def test_array_frontier_matches_dense(new_grid, monkeypatch, seed):
+    """
+    The frontier step of the numpy engine makes the same maps in as many steps as its
+    step of the whole map
+    """
+    frontier = new_grid("numpy", 30, 40, seed)
+    steps = run(frontier)
+    monkeypatch.setattr(ArrayGrid, "FRONTIER", False)
+    dense = new_grid("numpy", 30, 40, seed)
+    assert run(dense) == steps
+    assert (dense.type_array() == frontier.type_array()).all()
+    assert (dense.height_array() == frontier.height_array()).all()
@@ -0,0 +1,119 @@
+"""
+Exporting maps to files
+"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import export
+from cells import CELL_TYPES
+from palette import to_rgb
+
+
+def _map(rows, cols, seed=0):
+    """
+    Random type codes and heights of a map
+    """
+    rng = np.random.default_rng(seed)
+    types = rng.integers(len(CELL_TYPES), size=(rows, cols)).astype(np.uint8)
+    return types, rng.uniform(-120, 150, size=(rows, cols))
+
+
+def _scaled(pixels, scale):
+    return np.repeat(np.repeat(pixels, scale, axis=0), scale, axis=1)
+
+
+@pytest.mark.parametrize("scale", [1, 3])
+def test_png(tmp_path, monkeypatch, scale):
+    """
+    A PNG has the colors of the cells, scale x scale pixels each, its image data split
+    in several chunks
+    """
+    monkeypatch.setattr(export, "CHUNK_SIZE", 64)
+    types, height = _map(120, 150)
+    path = str(tmp_path / "map.png")
+    progress = []
+    export.save_png(types, height, path, scale, lambda *args: progress.append(args))
+    with Image.open(path) as image:
+        assert image.mode == "RGB"
+        pixels = np.array(image)
+    np.testing.assert_array_equal(pixels, _scaled(to_rgb(types, height), scale))
+    assert progress == [(done, 120) for done in range(1, 121)]
+    with open(path, "rb") as file:
+        assert file.read().count(b"IDAT") > 1
+
+
+def test_png_overlay(tmp_path):
+    """
+    What the overlay draws over a row of cells ends up in the PNG
+    """
+    types, height = _map(4, 5)
+
+    def overlay(i, block):
+        assert block.shape == (2, 10, 3)
+        if i == 1:
+            block[:, :4] = 255
+        return block
+
+    path = str(tmp_path / "map.png")
+    export.save_png(types, height, path, 2, overlay=overlay)
+    with Image.open(path) as image:
+        pixels = np.array(image)
+    expected = _scaled(to_rgb(types, height), 2)
+    expected[2:4, :4] = 255
+    np.testing.assert_array_equal(pixels, expected)
+
+
+@pytest.mark.parametrize("scale", [1, 2])
+def test_heightmap(tmp_path, scale):
+    """
+    A heightmap's 16-bit levels give back the heights of the cells, with the heights of
+    black and white in its text chunks
+    """
+    _, height = _map(13, 9)
+    path = str(tmp_path / "height.png")
+    export.save_heightmap(height, path, scale)
+    with Image.open(path) as image:
+        levels = np.array(image).astype(np.int64)
+        low, high = float(image.text["height_min"]), float(image.text["height_max"])
+    assert levels.shape == (13 * scale, 9 * scale)
+    assert (low, high) == (height.min(), height.max())
+    assert levels.min() == 0 and levels.max() == 65535
+    step = (high - low) / 65535
+    np.testing.assert_allclose(
+        low + levels * step, _scaled(height, scale), atol=step / 2 + 1e-9
+    )
+
+
+def test_flat_heightmap(tmp_path):
+    """
+    A map of a single height is black
+    """
+    path = str(tmp_path / "height.png")
+    export.save_heightmap(np.full((3, 4), 5.0), path)
+    with Image.open(path) as image:
+        assert not np.array(image).any()
+        assert image.text == {"height_min": "5.0", "height_max": "5.0"}
+
+
+def test_npz(tmp_path):
+    """
+    An archive has the type codes, the heights, the names of the types and the seed
+    """
+    types, height = _map(6, 7)
+    path = str(tmp_path / "map.npz")
+    export.save_arrays(types, height, path, "npz")
+    with np.load(path) as saved:
+        np.testing.assert_array_equal(saved["types"], types)
+        np.testing.assert_array_equal(saved["height"], height)
+        assert saved["type_names"].tolist() == [cls.TYPE for cls in CELL_TYPES]
+        assert str(saved["seed"]) == "npz"
+
+
+def test_unknown_format(tmp_path):
+    """
+    A file that is neither an archive nor a PNG is an error
+    """
+    with pytest.raises(ValueError):
+        export.save_arrays(*_map(2, 2), str(tmp_path / "map.jpg"))
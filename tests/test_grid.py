@@ -0,0 +1,89 @@
+"""
+Building blocks of the generation
+"""
+
+import numpy as np
+import pytest
+
+from array_grid import count_coeffs
+from cells import CELL_TYPES
+from grid import distance_transform, shore_water
+from palette import packed_color
+from tests.common import MAX_STEPS
+
+# pylint: disable=protected-access
+
+
+def _steps(grid):
+    """
+    Step a grid until all of its phases are over, yields after every step
+    """
+    for _ in range(MAX_STEPS):
+        is_stopped = grid.update_grid()
+        yield
+        if is_stopped:
+            return
+    raise AssertionError(f"the {grid.ENGINE} grid of seed {grid.seed!r} hangs")
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_distance_transform(seed):
+    """
+    Distances to the nearest True cell match a brute force search
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = rng.integers(1, 30, size=2)
+    mask = rng.random((rows, cols)) < rng.random() * 0.2
+    mask[rng.integers(rows), rng.integers(cols)] = True
+    xs, ys = np.indices(mask.shape)
+    targets = np.argwhere(mask)
+    expected = np.sqrt(
+        (xs[..., None] - targets[:, 0]) ** 2 + (ys[..., None] - targets[:, 1]) ** 2
+    ).min(axis=-1)
+    np.testing.assert_allclose(distance_transform(mask), expected)
+
+
+def test_distance_transform_empty():
+    """
+    A mask without True cells is infinitely far from every cell
+    """
+    assert np.isinf(distance_transform(np.zeros((4, 5), dtype=bool))).all()
+
+
+@pytest.mark.parametrize("height", [-120, -90, -3.75, 0, 10, 10.5, 37, 110, 150])
+def test_palette(height):
+    """
+    The precomputed colors are the ones of Cell.color
+    """
+    for code, cls in enumerate(CELL_TYPES):
+        cell = cls((0, 0))
+        cell.height = height
+        assert f"#{packed_color(code, height):06x}" == cell.color
+
+
+@pytest.mark.parametrize("seed", ["0", "1", "coeffs"])
+def test_neighbour_counts(new_grid, seed):
+    """
+    The same type counts patched around converted cells match a count of the whole map
+    after every step, secondary biome seeds included
+    """
+    grid = new_grid("reference", 20, 30, seed)
+    for _ in _steps(grid):
+        np.testing.assert_array_equal(grid._coeffs, count_coeffs(grid.type_array()))
+
+
+@pytest.mark.parametrize("seed", ["0", "1", "indexes"])
+def test_cell_indexes(new_grid, seed):
+    """
+    The cells of every type and the shore water, patched around converted cells, match
+    the ones of the whole map after every step
+    """
+    grid = new_grid("reference", 20, 30, seed)
+    for _ in _steps(grid):
+        types = grid.type_array()
+        for code, index in enumerate(grid._cells_of):
+            assert sorted(index) == [tuple(cell) for cell in np.argwhere(types == code)]
+            assert all(cell in index for cell in index)
+        assert sorted(grid._shore) == [
+            tuple(cell) for cell in np.argwhere(shore_water(types))
+        ]
@@ -0,0 +1,32 @@
+"""
+Recording a generation into a delta log and replaying it
+"""
+
+import numpy as np
+
+from replay import DeltaRecorder, Replay
+
+
+def test_replay_frames(engine, new_grid, tmp_path):
+    """
+    Every frame of the log is the map of its step, whichever order they are read in
+    """
+    grid = new_grid(engine, 28, 43, "replay")
+    path = str(tmp_path / "grid.tglog")
+    recorder = DeltaRecorder(path, grid, keyframe_interval=7)
+    grid.pop_changes()
+    frames = [(grid.type_array(), grid.height_array())]
+    is_stopped = False
+    while not is_stopped:
+        is_stopped = grid.update_grid()
+        recorder.record(grid.pop_changes())
+        frames.append((grid.type_array(), grid.height_array()))
+    recorder.close()
+    replay = Replay(path)
+    assert replay.steps == len(frames) - 1
+    order = list(range(len(frames)))
+    order += list(np.random.default_rng(0).permutation(len(frames)))
+    for step in order:
+        types, height = replay.frame(step)
+        np.testing.assert_array_equal(types, frames[step][0])
+        np.testing.assert_array_equal(height, frames[step][1])
@@ -0,0 +1,126 @@
+"""
+Compiling biome rules from their data files
+"""
+
+import copy
+import json
+import os
+import subprocess
+import sys
+import tomllib
+
+import numpy as np
+import pytest
+
+import rules
+from rules import compile_rules, load
+
+BIOMES = {
+    "seeds": {"starting": ["water", "land"], "secondary": ["land"]},
+    "void": {"color": "#000000", "threshold_age": 30},
+    "water": {
+        "color": "#0000ff",
+        "threshold_age": 500,
+        "submissive": ["void"],
+        "infect": [{}],
+    },
+    "land": {
+        "color": "#00ff00",
+        "threshold_age": 40,
+        "submissive": ["water"],
+        "infect": [{"above": 0.8, "age_divisor": 2}, {"targets": ["void"]}],
+    },
+}
+
+
+def _changed(path, value):
+    """
+    Get BIOMES with the value at a path of keys and indices replaced, or removed if
+    the value is None
+    """
+    data = copy.deepcopy(BIOMES)
+    table = data
+    for key in path[:-1]:
+        table = table[key]
+    if value is None:
+        del table[path[-1]]
+    else:
+        table[path[-1]] = value
+    return data
+
+
+def test_compile():
+    """
+    Biomes get their type IDs in order, and their transitions end up in the tables
+    """
+    rule_set = compile_rules(BIOMES)
+    assert rule_set.ids == {"void": 0, "water": 1, "land": 2}
+    assert rule_set.starting == (1, 2)
+    assert rule_set.secondary == (2,)
+    assert np.argwhere(rule_set.allowed).tolist() == [[1, 0], [2, 0], [2, 1]]
+    assert rule_set.above[2, 1] == 0.8 and rule_set.age_divisor[2, 1] == 2
+    assert rule_set.above[1, 0] == rule_set.above[2, 0] == -np.inf
+    land = rule_set.biomes[2].transitions
+    assert land[1].roll and not land[0].roll
+
+
+@pytest.mark.parametrize(
+    "path, value, message",
+    [
+        (("land", "size"), 3, r"unknown keys \['size'\] in land"),
+        (("land", "color"), None, "land has no color"),
+        (("land", "submissive"), ["lava"], "unknown biome 'lava' in land"),
+        (("land", "infect", 1, "targets"), ["lava"], "unknown biome 'lava' in land"),
+        (("land", "infect", 1, "chance"), 1, r"unknown keys \['chance'\] in land"),
+        (("land", "infect", 0, "above"), None, "adds to a roll but has no above"),
+        (("land", "infect", 1, "targets"), ["water"], "several transitions to water"),
+        (("seeds", "all"), [], r"unknown keys \['all'\] in seeds"),
+        (("seeds", "starting"), [], "seeds.starting has no biome"),
+        (("seeds", "starting"), None, "seeds.starting has no biome"),
+        (("seeds", "secondary"), ["lava"], "unknown biome 'lava' in seeds.secondary"),
+    ],
+)
+def test_invalid_rules(path, value, message):
+    """
+    Mistakes in a rules file are errors naming the file and the faulty table
+    """
+    with pytest.raises(ValueError, match=f"^biomes.toml: .*{message}"):
+        compile_rules(_changed(path, value), "biomes.toml")
+
+
+def test_json_rules(tmp_path):
+    """
+    A JSON rules file compiles to the same tables as the TOML one
+    """
+    with open(rules.DEFAULT_PATH, "rb") as file:
+        data = tomllib.load(file)
+    path = tmp_path / "biomes.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    expected, rule_set = load(rules.DEFAULT_PATH), load(str(path))
+    assert rule_set.ids == expected.ids
+    assert (rule_set.starting, rule_set.secondary) == (
+        expected.starting,
+        expected.secondary,
+    )
+    for name in ("allowed", "above", "age_divisor", "coeff_divisor", "coeff_low"):
+        np.testing.assert_array_equal(getattr(rule_set, name), getattr(expected, name))
+
+
+def test_rules_path(tmp_path):
+    """
+    The rules file named by the environment variable is the one the generation uses
+    """
+    data = copy.deepcopy(BIOMES)
+    data["swamp"] = data.pop("land")
+    data["seeds"] = {"starting": ["water", "swamp"]}
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    names = subprocess.run(
+        [sys.executable, "-c", "from rules import RULES; print(*RULES.ids)"],
+        cwd=os.path.dirname(rules.__file__),
+        env={**os.environ, rules.PATH_VARIABLE: str(path)},
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert names.split() == ["void", "water", "swamp"]
@@ -0,0 +1,23 @@
+"""
+Saving a generation and resuming it
+"""
+
+import pytest
+
+from tests.common import assert_same, run, state
+
+
+@pytest.mark.parametrize("steps", [0, 15, 60])
+def test_resume(engine, new_grid, tmp_path, steps):
+    """
+    A generation resumed from a snapshot ends with the same map as an uninterrupted
+    one
+    """
+    grid = new_grid(engine, 28, 43, "snapshot")
+    for _ in range(steps):
+        grid.update_grid()
+    path = str(tmp_path / "grid.snap")
+    grid.save_snapshot(path)
+    resumed = type(grid).from_snapshot(path)
+    assert run(resumed) == run(grid)
+    assert_same(state(resumed, tmp_path), state(grid, tmp_path))
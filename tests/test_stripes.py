@@ -0,0 +1,71 @@
+"""
+Stepping a map split into stripes
+"""
+
+import os
+
+import pytest
+
+import stripes
+from engines import available
+from tests.common import assert_same, run, state
+
+ENGINES = [name for name in ("numpy", "numba") if available(name)]
+
+
+@pytest.fixture(autouse=True)
+def small_stripes(monkeypatch):
+    """
+    Split the small maps of the tests into stripes of a single row at least
+    """
+    monkeypatch.setattr(stripes, "MIN_CELLS", 1)
+
+
+def _shared_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("seed", ["0", "stripes"])
+def test_workers(new_grid, tmp_path, engine, seed):
+    """
+    A map is the same for any number of workers, and the shared memory is freed
+    """
+    blocks = _shared_blocks()
+    single = new_grid(engine, 30, 20, seed)
+    steps = run(single)
+    expected = state(single, tmp_path)
+    for workers in (2, 3, 5):
+        grid = new_grid(engine, 30, 20, seed, workers)
+        assert run(grid) == steps
+        grid.close()
+        assert_same(state(grid, tmp_path), expected)
+    assert _shared_blocks() <= blocks
+
+
+def test_split_midway(new_grid, tmp_path):
+    """
+    A map can be split and joined again between any two steps
+    """
+    single = new_grid("numpy", 30, 20, "midway")
+    steps = run(single)
+    grid = new_grid("numpy", 30, 20, "midway")
+    plan = {5: 3, 20: 1, 40: 2, 41: 4, 70: 1}
+    for step in range(steps):
+        if plan.get(step) == 1:
+            grid.close()
+        elif step in plan:
+            grid.split(plan[step])
+        grid.update_grid()
+    grid.close()
+    assert_same(state(grid, tmp_path), state(single, tmp_path))
+
+
+def test_small_maps_stay_in_one_process(new_grid, monkeypatch):
+    """
+    A map too small for several stripes isn't split
+    """
+    monkeypatch.setattr(stripes, "MIN_CELLS", 1 << 16)
+    assert stripes.stripes((300, 300), 4) == 1
+    grid = new_grid("numpy", 30, 20, "small", 4)
+    assert grid._stripes is None  # pylint: disable=protected-access